@@ -0,0 +1,72 @@
+import os
+import hashlib
+import threading
+from cachetools import TTLCache
+from image_pipeline import hash_distance
+
+ANALYSIS_MEMO_SIZE = int(os.getenv("ANALYSIS_MEMO_SIZE", "512"))
+# Seconds a specialist analysis is reused for the same page
+ANALYSIS_MEMO_TTL = int(os.getenv("ANALYSIS_MEMO_TTL", "1800"))
+
+# Function to identify the prompts an analysis was made with, for the variant part of a memo key
+def prompt_variant(*prompts):
+    return hashlib.sha256("\x00".join(prompts).encode("utf-8")).hexdigest()[:16]
+
+class AnalysisMemo:
+    """
+    Memoized specialist-agent outputs, keyed by page fingerprint and agent model
+
+    Keys are (kind, model, fingerprint, variant) tuples: kind is "html" or
+    "image", the fingerprint is a hash of the normalized HTML or the
+    screenshot's perceptual hash, and variant is a hash of the prompts the
+    analysis was made with (see prompt_variant), so changing an agent's
+    instructions stops old analyses from being served. Entries expire after `ttl` seconds and the least recently
+    used are evicted past `maxsize`.
+    """
+
+    def __init__(self, maxsize=ANALYSIS_MEMO_SIZE, ttl=ANALYSIS_MEMO_TTL):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, max_distance=0):
+        """
+        Args:
+            key: (kind, model, fingerprint, variant)
+            max_distance: For integer (perceptual hash) fingerprints, the number
+                of differing bits still treated as the same page
+
+        Returns:
+            The memoized analysis, or None
+        """
+        kind = key[0]
+        with self._lock:
+            analysis = self.entries.get(key)
+            if analysis is None and max_distance:
+                self.entries.expire()
+                for cached_key in list(self.entries.keys()):
+                    if cached_key[0:2] == key[0:2] and cached_key[3] == key[3] and hash_distance(cached_key[2], key[2]) <= max_distance:
+                        analysis = self.entries[cached_key]
+                        break
+            counts = self.misses if analysis is None else self.hits
+            counts[kind] = counts.get(kind, 0) + 1
+            return analysis
+
+    def put(self, key, analysis):
+        with self._lock:
+            self.entries[key] = analysis
+
+    def stats(self):
+        with self._lock:
+            stats = {}
+            for kind in sorted(set(self.hits) | set(self.misses)):
+                hits, misses = self.hits.get(kind, 0), self.misses.get(kind, 0)
+                stats[kind] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+            stats["entries"] = len(self.entries)
+            return stats
+
+_analysis_memo = AnalysisMemo()
+
+def get_analysis_memo():
+    return _analysis_memo
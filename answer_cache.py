@@ -0,0 +1,155 @@
+import os
+import threading
+import numpy as np
+from cachetools import TTLCache
+from router import normalize_query
+
+# Cached answers expire after this many seconds even without a re-ingest
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+# Cosine similarity a query embedding needs to reuse the answer of another query
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+# Written by every ingest that changes the stored chunks
+INGEST_GENERATION_PATH = os.getenv("INGEST_GENERATION_PATH", "ingest_generation.txt")
+
+# Function to read the current ingest generation
+def get_ingest_generation(path=INGEST_GENERATION_PATH):
+    try:
+        with open(path, "r") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+# Function to mark that the stored chunks changed, invalidating every cached answer
+def bump_ingest_generation(path=INGEST_GENERATION_PATH):
+    generation = get_ingest_generation(path) + 1
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(generation))
+    os.replace(tmp_path, path)
+    print(f"Ingest generation is now {generation}")
+    return generation
+
+class AnswerCache:
+    """
+    Two-tier cache of generated answers
+
+    The first tier matches the normalized query text exactly; the second
+    matches the query embedding against the embeddings of cached queries.
+    Entries expire after `ttl` seconds, the least recently used entries are
+    evicted past `maxsize`, and every entry is tied to the ingest generation it
+    was answered under so a re-ingest invalidates the whole cache.
+
+    Args:
+        maxsize: Maximum number of cached answers
+        ttl: Seconds an answer stays valid
+        similarity: Minimum cosine similarity for a semantic hit
+        generation_path: File holding the ingest generation
+    """
+
+    def __init__(self, maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, similarity=ANSWER_CACHE_SIMILARITY, generation_path=INGEST_GENERATION_PATH):
+        self.similarity = similarity
+        self.generation_path = generation_path
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Normalized query vectors of the entries, kept apart so a similarity scan does not count as a use
+        self.vectors = {}
+        self._matrix = None
+        self._matrix_keys = []
+        self.generation = None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._generation_mtime = None
+        self._lock = threading.Lock()
+
+    # Function to drop every entry when an ingest has bumped the generation
+    def _check_generation(self):
+        try:
+            mtime = os.path.getmtime(self.generation_path)
+        except OSError:
+            mtime = None
+        if mtime != self._generation_mtime or self.generation is None:
+            self._generation_mtime = mtime
+            generation = get_ingest_generation(self.generation_path)
+            if generation != self.generation:
+                if self.entries:
+                    print(f"Ingest generation changed to {generation}, clearing {len(self.entries)} cached answers")
+                self.entries.clear()
+                self.vectors.clear()
+                self._matrix = None
+                self.generation = generation
+
+    def get_exact(self, query):
+        with self._lock:
+            self._check_generation()
+            entry = self.entries.get(normalize_query(query))
+            if entry is not None:
+                self.exact_hits += 1
+                return entry["answer"]
+            return None
+
+    # Function to stack the vectors of live entries into one matrix, rebuilt only after changes
+    def _vector_matrix(self):
+        # Expire stale entries and drop the vectors of entries the cache has evicted
+        self.entries.expire()
+        stale = [key for key in self.vectors if key not in self.entries]
+        for key in stale:
+            del self.vectors[key]
+        if stale or self._matrix is None:
+            self._matrix_keys = list(self.vectors)
+            self._matrix = np.stack([self.vectors[key] for key in self._matrix_keys]) if self.vectors else None
+        return self._matrix
+
+    def get_similar(self, query_vector):
+        """
+        Returns:
+            The answer of the most similar cached query, or None (counted as a miss)
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= max(np.linalg.norm(query), 1e-12)
+        with self._lock:
+            self._check_generation()
+            matrix = self._vector_matrix()
+            best_key, best_score = None, self.similarity
+            if matrix is not None and matrix.shape[1] == query.shape[0]:
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity:
+                    best_key, best_score = self._matrix_keys[best], float(scores[best])
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.semantic_hits += 1
+            print(f"Semantic cache hit on '{best_key}' with similarity {best_score:.4f}")
+            # Only the matched entry counts as recently used
+            return self.entries[best_key]["answer"]
+
+    def put(self, query, query_vector, answer):
+        key = normalize_query(query)
+        with self._lock:
+            self._check_generation()
+            self.entries[key] = {"answer": answer}
+            if query_vector is not None:
+                # Answers of queries that were never embedded only match exactly
+                vector = np.asarray(query_vector, dtype=np.float32)
+                self.vectors[key] = vector / max(np.linalg.norm(vector), 1e-12)
+            else:
+                self.vectors.pop(key, None)
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "generation": self.generation
+            }
+
+_answer_cache = AnswerCache()
+
+def get_answer_cache():
+    return _answer_cache
@@ -1,90 +1,157 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
 import os
+import json
+import asyncio
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import uvicorn
 from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from sse_starlette.sse import EventSourceResponse
 from ingest import ingest_components
-from query import process_query
-from chat import chat
-from openai import OpenAI
-import ssl
-import httpx
-import asyncio
+from query import aprocess_query, aprocess_query_stream
+from chat import chat, chat_stream
+from clients import get_async_openai_client, check_health, close_clients, aclose_clients
+from answer_cache import get_answer_cache
+from retrieval import is_embedded_backend
+from embedded_index import get_embedded_index
 
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "http://localhost:5173"}})
-
 COMPONENT_NAMES_FILE = "component_names.txt"
 
-# Create a custom SSL context that doesn't verify certificates
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
-# Create a custom HTTP client with SSL verification disabled
-http_client = httpx.Client(verify=False)
+# Maximum requests doing LLM work at the same time; the rest wait for a slot
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "256"))
+# Threads for blocking work (retrieval, embedding cache, ingestion) run off the event loop
+API_THREAD_WORKERS = int(os.getenv("API_THREAD_WORKERS", "32"))
+# Connections uvicorn accepts before answering 503
+API_LIMIT_CONCURRENCY = int(os.getenv("API_LIMIT_CONCURRENCY", "1024"))
+
+llm_slots = asyncio.Semaphore(API_MAX_CONCURRENCY)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=API_THREAD_WORKERS, thread_name_prefix="api")
+    )
+    yield
+    await aclose_clients()
+    close_clients()
+
+def error_response(message, status_code):
+    return JSONResponse({"error": message}, status_code=status_code)
 
-@app.route("/ingest", methods=["POST"])
-def ingest():
+# Function to read a JSON body, returning None for a missing or malformed one
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+def load_component_names():
+    try:
+        with open(COMPONENT_NAMES_FILE, "r") as f:
+            return [line.strip() for line in f.readlines()]
+    except FileNotFoundError:
+        return None
+
+async def health(request):
+    services = await asyncio.to_thread(check_health, not is_embedded_backend())
+    if is_embedded_backend():
+        index = await asyncio.to_thread(get_embedded_index)
+        services["embedded_index"] = {"ok": True} if index is not None else {"ok": False, "error": "Embedded index not exported yet"}
+    status = 200 if all(service["ok"] for service in services.values()) else 503
+    return JSONResponse(services, status_code=status)
+
+async def cache_stats(request):
+    return JSONResponse(get_answer_cache().stats())
+
+async def ingest(request):
     if not os.getenv("OPEN_API_KEY"):
-        return jsonify({"error": "OPEN_API_KEY not found in environment variables."}), 400
+        return error_response("OPEN_API_KEY not found in environment variables.", 400)
     try:
-        component_names = ingest_components()
+        component_names = await asyncio.to_thread(ingest_components)
         with open(COMPONENT_NAMES_FILE, "w") as f:
             f.write("\n".join(component_names))
-        return jsonify({"message": "Ingestion complete.", "component_names": component_names})
+        return JSONResponse({"message": "Ingestion complete.", "component_names": component_names})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(str(e), 500)
 
-@app.route("/query", methods=["POST"])
-def query():
+async def query(request):
     if not os.getenv("OPEN_API_KEY"):
-        return jsonify({"error": "OPEN_API_KEY not found in environment variables."}), 400
-    data = request.get_json()
+        return error_response("OPEN_API_KEY not found in environment variables.", 400)
+    data = await read_json(request)
     if not data or "query" not in data:
-        return jsonify({"error": "Missing 'query' in request body."}), 400
+        return error_response("Missing 'query' in request body.", 400)
+    component_names = load_component_names()
+    if component_names is None:
+        return error_response("Component names file not found. Please run /ingest first.", 400)
     try:
-        with open(COMPONENT_NAMES_FILE, "r") as f:
-            component_names = [line.strip() for line in f.readlines()]
-    except FileNotFoundError:
-        return jsonify({"error": "Component names file not found. Please run /ingest first."}), 400
+        async with llm_slots:
+            result = await aprocess_query(data["query"], component_names)
+        return JSONResponse({"response": result})
+    except Exception as e:
+        return error_response(str(e), 500)
+
+# Function to turn (event, data) pairs into server-sent events, holding an LLM slot while streaming
+async def sse_events(events):
     try:
-        result = process_query(data["query"], component_names)
-        return jsonify({"response": result})
+        async with llm_slots:
+            async for event, data in events:
+                yield {"event": event, "data": json.dumps(data)}
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        yield {"event": "error", "data": json.dumps({"error": str(e)})}
+
+def sse_response(events):
+    # Stop proxies from buffering the stream
+    return EventSourceResponse(sse_events(events), headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def query_stream(request):
+    """
+    Streaming variant of /query as server-sent events: "metadata" with the
+    retrieved sources first, then one "token" event per piece of the answer,
+    then "done" (or "error")
+    """
+    if not os.getenv("OPEN_API_KEY"):
+        return error_response("OPEN_API_KEY not found in environment variables.", 400)
+    data = await read_json(request)
+    if not data or "query" not in data:
+        return error_response("Missing 'query' in request body.", 400)
+    component_names = load_component_names()
+    if component_names is None:
+        return error_response("Component names file not found. Please run /ingest first.", 400)
+    return sse_response(aprocess_query_stream(data["query"], component_names))
 
-@app.route("/describe-image", methods=["POST"])
-def describe_image():
+async def describe_image(request):
     """
     Route to describe an image using OpenAI's Vision API
-    
+
     Expects a POST request with JSON body containing:
     {
         "image_url": "data:image/jpeg;base64,..."
     }
     """
     if not os.getenv("OPEN_API_KEY"):
-        return jsonify({"error": "OPEN_API_KEY not found in environment variables."}), 400
-    
-    data = request.get_json()
+        return error_response("OPEN_API_KEY not found in environment variables.", 400)
+
+    data = await read_json(request)
     print(f"Received data: {data}")  # Debugging line to check incoming data
 
     if not data or "image_url" not in data:
-        return jsonify({"error": "Missing 'image_url' in request body."}), 400
-    
+        return error_response("Missing 'image_url' in request body.", 400)
+
     try:
-        # Initialize OpenAI client similar to your example code
-        openai_client = OpenAI(
-            api_key=os.getenv("OPEN_API_KEY"),
-            http_client=http_client
-        )
-        
+        # Shared, keep-alive OpenAI client with SSL verification disabled
+        openai_client = get_async_openai_client(verify=False)
+
         # Base64 image URL should already be in format: data:image/jpeg;base64,...
         base64_image_url = data["image_url"]
 
         print(f"Received image URL: {base64_image_url[:30]}...")  # Print first 30 chars for debugging
-        
+
         # Create system prompt
         system_prompt = """
         You are an AI assistant which will visualize the image of seller's data and describe it in detail.
@@ -92,64 +159,94 @@ def describe_image():
         - Perform the analytics of the image and provide the details.
         - Just give the final summary of the data in simple layman's term.
         """
-        
+
         print("Calling openai")
 
-        # Call OpenAI API using the client pattern from your example
-        response = openai_client.chat.completions.create(
-            model="gpt-4.1",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {
-                    "role": "user", 
-                    "content": [
-                        { "type": "text", "text": "ONLY describe THE GRAPHS, IMAGES, MAPS, CHARTS in details for seller in layman's term. DONT CONSIDER THE TABLES AND OTHER TEXT APART FROM GRAPHS, IMAGES, MAPS, CHARTS" },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": base64_image_url},
-                        },
-                    ],
-                    # TO READ URLS
-                    # "content": [
-                    #     {"type": "text", "text": "Please describe this image in detail."},
-                    #     # can't give local blob image as openai trying to access, give invalid
-                    #     {"type": "image_url", "image_url": {"url": "https://userscreenshots.s3.ap-south-1.amazonaws.com/Screenshot+2025-05-17+at+9.58.08%E2%80%AFPM.png"}} 
-                    # ]
-                }
-            ],
-            max_tokens=300
-        )
-        
-        
+        async with llm_slots:
+            response = await openai_client.chat.completions.create(
+                model="gpt-4.1",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {
+                        "role": "user",
+                        "content": [
+                            { "type": "text", "text": "ONLY describe THE GRAPHS, IMAGES, MAPS, CHARTS in details for seller in layman's term. DONT CONSIDER THE TABLES AND OTHER TEXT APART FROM GRAPHS, IMAGES, MAPS, CHARTS" },
+                            {
+                                "type": "image_url",
+                                "image_url": {"url": base64_image_url},
+                            },
+                        ],
+                        # TO READ URLS
+                        # "content": [
+                        #     {"type": "text", "text": "Please describe this image in detail."},
+                        #     # can't give local blob image as openai trying to access, give invalid
+                        #     {"type": "image_url", "image_url": {"url": "https://userscreenshots.s3.ap-south-1.amazonaws.com/Screenshot+2025-05-17+at+9.58.08%E2%80%AFPM.png"}}
+                        # ]
+                    }
+                ],
+                max_tokens=300
+            )
+
         # Extract the description from the response
         description = response.choices[0].message.content
 
         print("Response received from OpenAI", description)
-        
-        return jsonify({
+
+        return JSONResponse({
             "success": True,
             "description": description
         })
-            
+
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(str(e), 500)
 
-@app.route("/chat", methods=["POST"])
-def get_details():
+async def get_details(request):
     if not os.getenv("OPEN_API_KEY"):
-        return jsonify({"error": "OPEN_API_KEY not found in environment variables."}), 400
-    
-    data = request.get_json()
+        return error_response("OPEN_API_KEY not found in environment variables.", 400)
+
+    data = await read_json(request)
     if not data or "user_input" not in data:
-        return jsonify({"error": "Missing 'user_input' in request body."}), 400
+        return error_response("Missing 'user_input' in request body.", 400)
 
     try:
-        # to wait for the result
-        result = asyncio.run(chat(data["user_input"]))
+        async with llm_slots:
+            result = await chat(data["user_input"])
         print("result", result)
-        return jsonify(result)
+        return JSONResponse(result)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(str(e), 500)
+
+async def chat_details_stream(request):
+    """
+    Streaming variant of /chat as server-sent events: "metadata" once the
+    specialist analysis is done, "token" events for the reply, then "done"
+    with the updated context (or "error")
+    """
+    if not os.getenv("OPEN_API_KEY"):
+        return error_response("OPEN_API_KEY not found in environment variables.", 400)
+
+    data = await read_json(request)
+    if not data or "user_input" not in data:
+        return error_response("Missing 'user_input' in request body.", 400)
+
+    return sse_response(chat_stream(data["user_input"]))
+
+app = Starlette(
+    routes=[
+        Route("/health", health, methods=["GET"]),
+        Route("/cache-stats", cache_stats, methods=["GET"]),
+        Route("/ingest", ingest, methods=["POST"]),
+        Route("/query", query, methods=["POST"]),
+        Route("/query/stream", query_stream, methods=["POST"]),
+        Route("/describe-image", describe_image, methods=["POST"]),
+        Route("/chat", get_details, methods=["POST"]),
+        Route("/chat/stream", chat_details_stream, methods=["POST"]),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["http://localhost:5173"], allow_methods=["*"], allow_headers=["*"])
+    ],
+    lifespan=lifespan
+)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5001, debug=True) 
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=5001, limit_concurrency=API_LIMIT_CONCURRENCY)
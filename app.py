@@ -1,19 +1,21 @@
 import os
 import argparse
 from dotenv import load_dotenv
-from ingest import ingest_components
+from ingest import ingest_components, ingest_from_snapshot
+from snapshot import default_snapshot_path
+from browser_pool import DEFAULT_SCRAPE_WORKERS
+from indexing import migrate_to_shared_collection
 from query import process_query
-from langchain_openai import OpenAIEmbeddings
-from qdrant_client import QdrantClient
-from langchain_core.documents import Document
-from openai import OpenAI
+from embedding_cache import get_embeddings
+from clients import get_openai_client, get_qdrant_client
+from retrieval import search_collection_by_vector, collection_exists
 
 # Load environment variables
 load_dotenv()
 
 def direct_vector_search(query, collection_name, top_k=3):
     """
-    Perform direct vector search on a Qdrant collection without routing
+    Perform direct vector search on a collection without routing
     
     Args:
         query: The user query string
@@ -28,51 +30,26 @@ def direct_vector_search(query, collection_name, top_k=3):
         return "OPEN_API_KEY not found in environment variables. Cannot perform search."
     
     try:
-        # Initialize Qdrant client
-        client = QdrantClient(url="http://localhost:6333")
+        # Shared Qdrant client
+        client = get_qdrant_client()
         
         # Check if collection exists
-        if not client.collection_exists(collection_name):
+        if not collection_exists(client, collection_name):
             return f"Collection '{collection_name}' does not exist"
         
-        # Initialize OpenAI embeddings
-        embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            api_key=os.getenv("OPEN_API_KEY")
-        )
+        # Initialize OpenAI embeddings (cached on disk)
+        embeddings = get_embeddings()
         
         # Generate query embedding
         query_embedding = embeddings.embed_query(query)
         
-        # Perform direct search against collection
-        search_results = client.search(
-            collection_name=collection_name,
-            query_vector=query_embedding,
-            limit=top_k
-        )
-        
-        # Process results
-        results = []
-        for scored_point in search_results:
-            payload = scored_point.payload
-            score = scored_point.score
-            
-            # Convert to document for easier handling
-            doc = Document(
-                page_content=payload.get("page_content", ""),
-                metadata={
-                    **payload.get("metadata", {}),
-                    "score": score
-                }
-            )
-            results.append(doc)
+        # Perform direct search against collection (hits keep their score in metadata)
+        results = search_collection_by_vector(client, collection_name, query_embedding, k=top_k)
         
         # Generate response with OpenAI
         if results:
-            # Initialize OpenAI client
-            openai_client = OpenAI(
-                api_key=os.getenv("OPEN_API_KEY"),
-            )
+            # Shared, keep-alive OpenAI client
+            openai_client = get_openai_client()
             
             # Build context from results
             context = "\n\n".join([doc.page_content for doc in results])
@@ -119,6 +96,11 @@ def main():
     parser = argparse.ArgumentParser(description="RAG application for Appliqué Design System")
     parser.add_argument("--ingest", action="store_true", help="Run the data ingestion process")
     parser.add_argument("--query", type=str, help="Query to process with intelligent routing")
+    parser.add_argument("--snapshot", nargs="?", const="", help="With --ingest, save the scraped corpus to a compressed snapshot (optional path)")
+    parser.add_argument("--from-snapshot", type=str, help="Rebuild the collections from a corpus snapshot without scraping")
+    parser.add_argument("--migrate-shared", action="store_true", help="Copy the per-component collections into the shared collection")
+    parser.add_argument("--drop-legacy", action="store_true", help="With --migrate-shared, delete each per-component collection after copying")
+    parser.add_argument("--workers", type=int, default=DEFAULT_SCRAPE_WORKERS, help="Number of headless browsers used while ingesting")
     args = parser.parse_args()
     
     # Check if we have API keys
@@ -132,13 +114,34 @@ def main():
     if args.ingest:
         # Run ingestion
         print("Starting data ingestion process...")
-        component_names = ingest_components()
+        snapshot_path = None
+        if args.snapshot is not None:
+            snapshot_path = args.snapshot or default_snapshot_path()
+        component_names = ingest_components(workers=args.workers, snapshot_path=snapshot_path)
         
         # Save component names to file
         with open(component_names_file, "w") as f:
             f.write("\n".join(component_names))
         print(f"Component names saved to {component_names_file}")
         
+    elif args.from_snapshot:
+        # Re-index from a saved corpus, no browser needed
+        print(f"Rebuilding collections from snapshot {args.from_snapshot}...")
+        try:
+            component_names = ingest_from_snapshot(args.from_snapshot)
+        except (OSError, ValueError, RuntimeError) as e:
+            # Keep the existing component names rather than replacing them with a partial list
+            print(f"Error rebuilding from snapshot: {str(e)}")
+            return
+        
+        with open(component_names_file, "w") as f:
+            f.write("\n".join(component_names))
+        print(f"Component names saved to {component_names_file}")
+        
+    elif args.migrate_shared:
+        # Move to a single collection with an indexed component_name payload field
+        migrate_to_shared_collection(get_qdrant_client(), drop_source=args.drop_legacy)
+        
     elif args.query:
         # Load component names from file
         try:
@@ -158,6 +161,9 @@ def main():
         print("Please specify one of the following options:")
         print("  --ingest to populate the database")
         print("  --query \"Your question\" to ask a question with intelligent routing")
+        print("  --ingest --snapshot to also save the scraped corpus to snapshots/")
+        print("  --from-snapshot PATH to rebuild the database from a saved corpus")
+        print("  --migrate-shared to move per-component collections into one shared collection")
         print("\nExamples:")
         print("  python app.py --ingest")
         print("  python app.py --query \"How do I create a modal dialog in Appliqué?\"")
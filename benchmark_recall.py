@@ -0,0 +1,168 @@
+import os
+import time
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import models
+from clients import get_qdrant_client
+from embedding_cache import EMBEDDING_MODEL, CachedEmbeddings, get_embeddings, truncate_embedding
+from embedding_batcher import embed_texts
+from indexing import get_quantization_config
+from retrieval import get_search_params
+
+# Load environment variables
+load_dotenv()
+
+# Scratch collection; outside the applique_ prefix so ingest and the query path never see it
+BENCHMARK_COLLECTION_NAME = "benchmark_recall"
+COMPONENT_NAMES_FILE = "component_names.txt"
+# Queries asked about every component when no query file is given
+QUERY_TEMPLATES = [
+    "How do I use the {name} component?",
+    "What props does {name} take?",
+    "Show an example of {name}",
+]
+
+SCROLL_BATCH_SIZE = 256
+UPSERT_BATCH_SIZE = 256
+
+# Function to read the text of every stored chunk
+def load_chunk_texts(client, max_chunks=None):
+    texts = {}
+    collection_names = [
+        collection.name
+        for collection in client.get_collections().collections
+        if collection.name.startswith("applique_")
+    ]
+    for collection_name in collection_names:
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=SCROLL_BATCH_SIZE,
+                offset=offset,
+                with_payload=["page_content"],
+                with_vectors=False
+            )
+            for point in points:
+                text = (point.payload or {}).get("page_content")
+                if text:
+                    texts[text] = None
+            if offset is None:
+                break
+    texts = list(texts)
+    return texts[:max_chunks] if max_chunks else texts
+
+# Function to read benchmark queries from a file, or build them from the component names
+def load_queries(path=None):
+    if path:
+        with open(path, "r") as f:
+            return [line.strip() for line in f if line.strip()]
+    with open(COMPONENT_NAMES_FILE, "r") as f:
+        names = [line.strip() for line in f if line.strip()]
+    return [template.format(name=name) for name in names for template in QUERY_TEMPLATES]
+
+# Function to find the exact top-k chunks of every query by brute force
+def exact_top_k(doc_matrix, query_matrix, k):
+    scores = query_matrix @ doc_matrix.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+# Function to measure one vector layout against the full-precision ground truth
+def benchmark_layout(client, doc_vectors, query_vectors, truth, k, dimensions, quantization, oversampling):
+    """
+    Load the truncated vectors into a scratch collection with the given
+    quantization and search it like the query path does
+
+    Returns:
+        A dictionary with recall@k, mean and p95 search latency and the
+        estimated size of the vectors searched in memory
+    """
+    if client.collection_exists(BENCHMARK_COLLECTION_NAME):
+        client.delete_collection(BENCHMARK_COLLECTION_NAME)
+    client.create_collection(
+        collection_name=BENCHMARK_COLLECTION_NAME,
+        vectors_config=models.VectorParams(size=dimensions, distance=models.Distance.COSINE),
+        quantization_config=get_quantization_config(quantization)
+    )
+    for start in range(0, len(doc_vectors), UPSERT_BATCH_SIZE):
+        client.upsert(
+            collection_name=BENCHMARK_COLLECTION_NAME,
+            points=[
+                models.PointStruct(id=start + i, vector=truncate_embedding(vector, dimensions))
+                for i, vector in enumerate(doc_vectors[start:start + UPSERT_BATCH_SIZE])
+            ]
+        )
+
+    search_params = get_search_params(quantization, oversampling)
+    recalls, latencies = [], []
+    for query_vector, expected in zip(query_vectors, truth):
+        started = time.perf_counter()
+        hits = client.search(
+            collection_name=BENCHMARK_COLLECTION_NAME,
+            query_vector=truncate_embedding(query_vector, dimensions),
+            search_params=search_params,
+            with_payload=False,
+            limit=k
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len({hit.id for hit in hits} & expected) / k)
+
+    bits_per_dimension = {"scalar": 8, "binary": 1}.get(quantization, 32)
+    return {
+        "recall": float(np.mean(recalls)),
+        "mean_ms": float(np.mean(latencies)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "memory_mb": len(doc_vectors) * dimensions * bits_per_dimension / 8 / 1e6
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k of reduced-dimension and quantized vector layouts")
+    parser.add_argument("--k", type=int, default=5, help="Number of results compared per query")
+    parser.add_argument("--dimensions", type=str, default="1536,1024,512,256", help="Comma-separated vector lengths to try")
+    parser.add_argument("--quantization", type=str, default="none,scalar,binary", help="Comma-separated quantization modes to try")
+    parser.add_argument("--oversampling", type=float, default=2.0, help="Oversampling factor of the full-precision rescore")
+    parser.add_argument("--queries", type=str, help="File with one query per line (default: questions about every component)")
+    parser.add_argument("--max-chunks", type=int, help="Only use this many stored chunks")
+    args = parser.parse_args()
+
+    if not os.getenv("OPEN_API_KEY"):
+        print("OPEN_API_KEY not found in environment variables.")
+        return
+
+    client = get_qdrant_client()
+    texts = load_chunk_texts(client, args.max_chunks)
+    queries = load_queries(args.queries)
+    if len(texts) < args.k or not queries:
+        print("Not enough stored chunks or queries to benchmark, run an ingest first")
+        return
+
+    # Full-length vectors from the shared cache, whatever EMBEDDING_DIMENSIONS is set to
+    embeddings = CachedEmbeddings(get_embeddings().embeddings, EMBEDDING_MODEL, dimensions=0)
+    doc_vectors = embed_texts(texts, embeddings)
+    query_vectors = embed_texts(queries, embeddings)
+
+    doc_matrix = np.asarray(doc_vectors, dtype=np.float32)
+    doc_matrix /= np.linalg.norm(doc_matrix, axis=1, keepdims=True)
+    query_matrix = np.asarray(query_vectors, dtype=np.float32)
+    query_matrix /= np.linalg.norm(query_matrix, axis=1, keepdims=True)
+    truth = exact_top_k(doc_matrix, query_matrix, args.k)
+    print(f"Benchmarking {len(queries)} queries against {len(texts)} chunks, ground truth is exact float32 search at {doc_matrix.shape[1]} dimensions\n")
+
+    print(f"{'dimensions':>10} {'quantization':>12} {f'recall@{args.k}':>10} {'mean ms':>8} {'p95 ms':>8} {'vectors MB':>10}")
+    try:
+        for dimensions in [int(value) for value in args.dimensions.split(",")]:
+            for quantization in [value.strip() for value in args.quantization.split(",")]:
+                result = benchmark_layout(
+                    client, doc_vectors, query_vectors, truth, args.k, min(dimensions, doc_matrix.shape[1]), quantization, args.oversampling
+                )
+                print(
+                    f"{dimensions:>10} {quantization:>12} {result['recall']:>10.3f} {result['mean_ms']:>8.2f} "
+                    f"{result['p95_ms']:>8.2f} {result['memory_mb']:>10.2f}"
+                )
+    finally:
+        if client.collection_exists(BENCHMARK_COLLECTION_NAME):
+            client.delete_collection(BENCHMARK_COLLECTION_NAME)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+# Number of concurrent browser workers used while scraping
+DEFAULT_SCRAPE_WORKERS = int(os.getenv("SCRAPE_WORKERS", "4"))
+
+# Function to build the Chrome options shared by every pooled driver
+def get_chrome_options():
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  # Run in headless mode
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    return chrome_options
+
+class BrowserPool:
+    """
+    Pool of long-lived headless Chrome drivers shared by scraping threads
+
+    Drivers are started lazily (at most `size` of them), handed out one per
+    thread and put back after each page. A driver that raises a
+    WebDriverException is quit, which frees its slot: a thread waiting for a
+    driver is woken up and starts a fresh one.
+
+    Args:
+        size: Maximum number of drivers (and therefore concurrent pages)
+    """
+
+    def __init__(self, size=DEFAULT_SCRAPE_WORKERS):
+        self.size = max(1, size)
+        self._idle = deque()
+        self._lock = threading.Lock()
+        # Signalled whenever a driver is released or a slot frees up
+        self._available = threading.Condition(self._lock)
+        self._created = 0
+        self._driver_path_lock = threading.Lock()
+        self._driver_path = None
+        self._closed = False
+        self.recycled = 0
+
+    # Resolve the chromedriver binary once instead of once per page
+    def _get_driver_path(self):
+        with self._driver_path_lock:
+            if self._driver_path is None:
+                self._driver_path = ChromeDriverManager().install()
+            return self._driver_path
+
+    def _start_driver(self):
+        return webdriver.Chrome(service=Service(self._get_driver_path()), options=get_chrome_options())
+
+    def acquire(self):
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError("BrowserPool is closed")
+                if self._idle:
+                    return self._idle.popleft()
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                # All drivers are busy, wait for one to be released or discarded
+                self._available.wait()
+
+        try:
+            return self._start_driver()
+        except Exception:
+            with self._available:
+                self._created -= 1
+                self._available.notify()
+            raise
+
+    def release(self, driver, broken=False):
+        if broken or self._closed:
+            self._discard(driver)
+            if broken:
+                with self._lock:
+                    self.recycled += 1
+                    recycled = self.recycled
+                print(f"Recycled crashed browser driver (total recycled: {recycled})")
+            return
+        with self._available:
+            self._idle.append(driver)
+            self._available.notify()
+
+    def _discard(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    @contextmanager
+    def driver(self):
+        """
+        Borrow a driver for the duration of a `with` block, recycling it on crash
+        """
+        driver = self.acquire()
+        broken = False
+        try:
+            yield driver
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            self.release(driver, broken=broken)
+
+    def run(self, func, retries=1):
+        """
+        Call `func(driver)` with a pooled driver, retrying on a fresh driver if it crashes
+
+        Args:
+            func: Callable receiving a Selenium driver
+            retries: How many times to retry with a recycled driver
+
+        Returns:
+            Whatever `func` returns
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.driver() as driver:
+                    return func(driver)
+            except WebDriverException as e:
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                print(f"Browser driver failed ({e.__class__.__name__}), retrying with a fresh driver")
+
+    def close(self):
+        with self._available:
+            self._closed = True
+            drivers = list(self._idle)
+            self._idle.clear()
+            # Waiting threads see the pool is closed
+            self._available.notify_all()
+        for driver in drivers:
+            self._discard(driver)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,28 +1,21 @@
 from agents import Agent, Runner, set_default_openai_client, set_tracing_disabled
 from dotenv import load_dotenv
-import httpx
-import ssl
 import asyncio
-from openai import AsyncOpenAI
+import time
+from openai.types.responses import ResponseTextDeltaEvent
+from clients import get_async_openai_client
+from html_reducer import reduce_html
+from image_pipeline import get_image_pipeline
+from sessions import get_session_store, fold_old_turns, fingerprint_html
+from analysis_memo import get_analysis_memo, prompt_variant
+from intent import classify_intent, GREETING, FOLLOW_UP, FULL_ANALYSIS
 import os
 import base64
-import re
 
 load_dotenv()
 
-# Create SSL context with verification disabled
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
-
-# Create HTTP client with SSL verification disabled
-http_client = httpx.AsyncClient(verify=False)
-
-# Create custom OpenAI client with disabled SSL verification
-custom_openai_client = AsyncOpenAI(
-    api_key=os.getenv("OPEN_API_KEY"),
-    http_client=http_client
-)
+# Shared OpenAI client with disabled SSL verification
+custom_openai_client = get_async_openai_client(verify=False)
 
 # Set the custom client as the default for all agents
 set_default_openai_client(custom_openai_client)
@@ -30,6 +23,10 @@ set_default_openai_client(custom_openai_client)
 # Disable tracing to avoid SSL issues with tracing endpoint
 set_tracing_disabled(True)
 
+# Seconds each specialist agent may take before the summary goes ahead without it
+HTML_AGENT_TIMEOUT = float(os.getenv("HTML_AGENT_TIMEOUT", "45"))
+IMAGE_AGENT_TIMEOUT = float(os.getenv("IMAGE_AGENT_TIMEOUT", "45"))
+
 # Generic Chat Agent for simple greetings and basic conversations
 generic_chat_agent = Agent(
     name="Generic Chat Assistant",
@@ -105,150 +102,282 @@ seller_summary_agent = Agent(
     model="gpt-4.1"
 )
 
-def is_generic_chat(chat_input):
+# Requests sent with the page to each specialist agent
+HTML_ANALYSIS_PROMPT = "Analyze this page."
+IMAGE_ANALYSIS_PROMPT = "Please analyze the provided screenshot/image for business insights, UI elements, charts, graphs, or any visual data that could help a seller improve their business operations."
+
+# Memoized analyses made with other instructions or requests are not reused
+HTML_MEMO_VARIANT = prompt_variant(html_agent.instructions, HTML_ANALYSIS_PROMPT)
+IMAGE_MEMO_VARIANT = prompt_variant(image_reader_agent.instructions, IMAGE_ANALYSIS_PROMPT)
+
+# Function to run one specialist agent within its deadline
+async def run_specialist(label, agent, agent_input, timeout):
     """
-    Determine if the input is a generic greeting or simple conversation.
+    Returns:
+        The agent's final output, or None if it failed or missed the deadline
+        (the run is cancelled in that case)
+    """
+    started = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(Runner.run(agent, agent_input), timeout)
+        print(f"{label} finished in {time.perf_counter() - started:.1f}s")
+        return result.final_output
+    except asyncio.TimeoutError:
+        print(f"{label} missed its {timeout:g}s deadline, continuing without it")
+    except Exception as e:
+        print(f"{label} failed, continuing without it: {e}")
+    return None
+
+# Function to format the last few conversation turns for an agent prompt
+def build_context_string(context):
+    context_string = ""
+    if context:
+        context_string = "\n\nPrevious Conversation Context:\n"
+        for i, ctx_item in enumerate(context[-5:], 1):  # Keep last 5 context items
+            context_string += f"{i}. {ctx_item}\n"
+        context_string += "\n"
+    return context_string
+
+# Function to summarize a finished turn for the conversation context
+def build_context_item(chat_input, label, output):
+    if label == "Analysis" and len(output) > 200:
+        return f"User: {chat_input} | Analysis: {output[:200]}..."
+    return f"User: {chat_input} | {label}: {output}"
+
+async def prepare_final_run(user_input_data):
+    """
+    Run every step that comes before the agent writing the reply.
+    Note: Frontend always provides HTML and screenshot data.
+    
+    Returns:
+        (agent, agent_input, label) where label names the reply in the conversation context
     """
-    if not chat_input:
-        return False
+    chat_input = user_input_data.get('chatInput', '')
+    html_content = user_input_data.get('html', '')
+    screenshot = user_input_data.get('screenshot', '')
+    context = user_input_data.get('context', [])  # Previous conversation context
     
-    chat_lower = chat_input.lower().strip()
+    print(f"Processing request - Chat: '{chat_input}', HTML: {len(html_content)} chars, Image: {'Yes' if screenshot else 'No'}, Context items: {len(context)}")
     
-    # Common greetings and simple queries
-    generic_patterns = [
-        r'^(hi|hello|hey|good morning|good afternoon|good evening).*',
-        r'^how are you.*',
-        r'^what.*can.*you.*do.*',
-        r'^help.*',
-        r'^thank.*you.*',
-        r'^thanks.*',
-        r'^bye.*',
-        r'^goodbye.*'
-    ]
+    # Build context string from previous interactions
+    context_string = build_context_string(context)
     
-    for pattern in generic_patterns:
-        if re.match(pattern, chat_lower):
-            return True
+    # Decide locally which agents this message needs
+    decision = classify_intent(chat_input, has_context=bool(context))
+    print(f"Intent: {decision.intent} (scores {decision.scores}, matched {decision.matched}) in {decision.elapsed_us:.0f}us")
     
-    return False
+    # Handle generic chat scenarios (regardless of HTML/screenshot presence)
+    if decision.intent == GREETING:
+        print("Routing to generic chat agent")
+        return generic_chat_agent, f"{context_string}Current User Input: {chat_input}", "Assistant"
+    
+    # Follow-ups reuse memoized analyses of the page but never start new specialist runs,
+    # as long as the page is the one analyzed before
+    if decision.intent == FOLLOW_UP and user_input_data.get('pageChanged'):
+        print(f"Page changed since the last turn ({', '.join(user_input_data['pageChanged'])}), analyzing it instead")
+        decision.intent = FULL_ANALYSIS
+    follow_up = decision.intent == FOLLOW_UP
+    
+    def page_changed(kind):
+        # Without a session, a memo miss is how a follow-up turns out to be about another page
+        nonlocal follow_up
+        print(f"No memoized {kind} analysis of this page, analyzing it instead of treating the message as a follow-up")
+        decision.intent = FULL_ANALYSIS
+        follow_up = False
+    
+    # Specialist agents to run, as (label, agent, input, deadline, memo key)
+    specialists = []
+    # Analyses of this page memoized by an earlier turn
+    cached_results = []
+    analysis_memo = get_analysis_memo()
+    
+    # Analyze HTML content (always provided by frontend)
+    if html_content and (decision.run_html or follow_up):
+        # Send the agent compact semantic markup instead of the raw page (parsing runs off the event loop)
+        reduced_html, html_stats = await asyncio.to_thread(reduce_html, html_content)
+        print(f"Reduced HTML from {html_stats['tokens_before']} to {html_stats['tokens_after']} tokens ({html_stats['bytes_before']} -> {html_stats['bytes_after']} bytes)")
+        html_key = ("html", html_agent.model, fingerprint_html(reduced_html), HTML_MEMO_VARIANT)
+        cached_analysis = analysis_memo.get(html_key)
+        if cached_analysis is not None:
+            print("Reusing the HTML analysis of an unchanged page")
+            cached_results.append(f"HTML Analysis:\n{cached_analysis}")
+        else:
+            if follow_up:
+                page_changed("HTML")
+            # The analysis describes the page itself, so follow-up questions can reuse it
+            html_context = f"{HTML_ANALYSIS_PROMPT}\n\nHTML Content:\n{reduced_html}"
+            specialists.append(("HTML Analysis", html_agent, html_context, HTML_AGENT_TIMEOUT, html_key))
+    
+    # Analyze image content (always provided by frontend)
+    if screenshot and (decision.run_image or follow_up):
+        image_pipeline = get_image_pipeline()
+        try:
+            # Decoded and downscaled once per distinct screenshot, off the event loop
+            image = await asyncio.to_thread(image_pipeline.prepare, screenshot)
+        except Exception as e:
+            print(f"Could not decode the screenshot, skipping image analysis: {e}")
+            image = None
+        
+        if image:
+            image_key = ("image", image_reader_agent.model, image.phash, IMAGE_MEMO_VARIANT)
+            cached_analysis = analysis_memo.get(image_key, max_distance=image_pipeline.hash_distance)
+            if cached_analysis is not None:
+                print("Reusing the image analysis of an unchanged screen")
+                cached_results.append(f"Image Analysis:\n{cached_analysis}")
+            else:
+                if follow_up:
+                    page_changed("image")
+                print(f"Prepared screenshot {image.width}x{image.height} ({image.bytes_before} -> {image.bytes_after} bytes)")
+                image_input = [{
+                    "role": "user",
+                    "content": [
+                        {"type": "input_text", "text": IMAGE_ANALYSIS_PROMPT},
+                        {"type": "input_image", "image_url": image.data_url, "detail": "auto"}
+                    ]
+                }]
+                specialists.append(("Image Analysis", image_reader_agent, image_input, IMAGE_AGENT_TIMEOUT, image_key))
+    
+    if specialists or cached_results:
+        # The specialists are independent, so they run concurrently
+        if specialists:
+            print(f"Running {len(specialists)} specialist agents concurrently...")
+        outputs = await asyncio.gather(*(run_specialist(*specialist[:4]) for specialist in specialists))
+        analysis_results = cached_results + [f"{label}:\n{output}" for (label, *_), output in zip(specialists, outputs) if output is not None]
+        analysis_results.sort()  # HTML before image, whichever came from the memo
+        missing = [label for (label, *_), output in zip(specialists, outputs) if output is None]
+        
+        # Remember the analyses for follow-up questions about the same page
+        for (*_, memo_key), output in zip(specialists, outputs):
+            if output is not None:
+                analysis_memo.put(memo_key, output)
+        if cached_results:
+            print(f"Analysis memo: {analysis_memo.stats()}")
+        
+        # Summarize whatever finished; only give up when no specialist did
+        if not analysis_results:
+            raise RuntimeError(f"No content analysis finished in time ({', '.join(missing)} unavailable)")
+        
+        # Generate seller summary from analysis results
+        print("Generating seller summary...")
+        summary_context = f"{context_string}User Query: {chat_input}\n\n" + "\n\n".join(analysis_results)
+        if missing:
+            summary_context += f"\n\nNote: {', '.join(missing)} is unavailable for this request. Base the summary on the analysis above and briefly mention that it is partial."
+        summary_context += "\n\nPlease provide a comprehensive business summary in simple terms that helps the seller understand their page/content and how to improve their sales."
+        return seller_summary_agent, summary_context, "Analysis"
+    
+    # Fallback if no content to analyze, or a follow-up answered from the conversation alone
+    print("No page analysis to summarize - using generic response")
+    full_input = f"{context_string}Current User Input: {chat_input or 'Hello! How can I help you with your business today?'}"
+    return generic_chat_agent, full_input, "Assistant"
 
-def requires_analysis(chat_input):
+# Function to attach the server-side session a request refers to, if any
+async def open_session(user_input_data):
     """
-    Determine if the input explicitly requests detailed analysis of content.
-    Note: HTML and screenshot are always provided by frontend, so we only check the chat input.
+    Returns:
+        (session, user_input_data) where, for a request with a sessionId, the
+        context comes from the stored session and an omitted HTML or screenshot
+        is filled in from the previous turn; session is None otherwise
     """
-    if not chat_input:
-        return False
-    
-    analysis_keywords = [
-        'explain', 'analyze', 'what is', 'describe', 'tell me about',
-        'insights', 'summary', 'overview', 'details', 'information',
-        'performance', 'sales', 'business', 'improve', 'optimize',
-        'show me', 'review', 'check', 'look at', 'examine'
-    ]
+    session_id = user_input_data.get('sessionId')
+    if not session_id:
+        return None, user_input_data
     
-    chat_lower = chat_input.lower()
-    return any(keyword in chat_lower for keyword in analysis_keywords)
+    session = await asyncio.to_thread(get_session_store().get_or_create, str(session_id))
+    html, screenshot, changed = session.update_page(user_input_data.get('html', ''), user_input_data.get('screenshot', ''))
+    print(f"Session {session_id}: {len(session.turns)} recent turns, summary: {'yes' if session.summary else 'no'}, page changed: {', '.join(changed) or 'no'}")
+    return session, {**user_input_data, 'html': html, 'screenshot': screenshot, 'context': session.context_items(), 'pageChanged': changed}
+
+# Function to record a finished turn and describe the session for the client
+async def close_session(session, context_item):
+    store = get_session_store()
+    async with store.update_lock(session.session_id):
+        # Other requests (or processes) may have finished turns since this one started
+        latest = await asyncio.to_thread(store.get, session.session_id)
+        if latest is not None and latest is not session:
+            latest.update_page(session.html, session.screenshot)
+            session = latest
+        session.turns.append(context_item)
+        await fold_old_turns(session)
+        await asyncio.to_thread(store.save, session)
+    return {
+        "sessionId": session.session_id,
+        # Clients can compare these and leave out an unchanged html/screenshot next turn
+        "htmlFingerprint": session.html_fingerprint,
+        "screenshotFingerprint": session.screenshot_fingerprint
+    }
 
 async def chat(user_input_data):
     """
     Enhanced chat function with agent orchestration and context management.
     Note: Frontend always provides HTML and screenshot data.
+    
+    With a 'sessionId' the conversation is kept on the server and the client
+    need not send 'context', nor 'html'/'screenshot' when they are unchanged.
     """
     try:
+        session, user_input_data = await open_session(user_input_data)
         chat_input = user_input_data.get('chatInput', '')
-        html_content = user_input_data.get('html', '')
-        screenshot = user_input_data.get('screenshot', '')
-        context = user_input_data.get('context', [])  # Previous conversation context
+        context = user_input_data.get('context', [])
         
-        print(f"Processing request - Chat: '{chat_input}', HTML: {len(html_content)} chars, Image: {'Yes' if screenshot else 'No'}, Context items: {len(context)}")
+        agent, agent_input, label = await prepare_final_run(user_input_data)
+        response = await Runner.run(agent, agent_input)
         
-        # Build context string from previous interactions
-        context_string = ""
-        if context:
-            context_string = "\n\nPrevious Conversation Context:\n"
-            for i, ctx_item in enumerate(context[-5:], 1):  # Keep last 5 context items
-                context_string += f"{i}. {ctx_item}\n"
-            context_string += "\n"
-        
-        # Handle generic chat scenarios (regardless of HTML/screenshot presence)
-        if is_generic_chat(chat_input):
-            print("Routing to generic chat agent")
-            full_input = f"{context_string}Current User Input: {chat_input}"
-            response = await Runner.run(generic_chat_agent, full_input)
-            
-            # Add to context and return
-            new_context_item = f"User: {chat_input} | Assistant: {response.final_output}"
-            updated_context = context + [new_context_item]
-            
+        # Add to context and return
+        context_item = build_context_item(chat_input, label, response.final_output)
+        if session:
+            session_info = await close_session(session, context_item)
             return {
                 "response": response.final_output,
-                "context": updated_context
+                "context": session.context_items(),
+                "session": session_info
             }
+        return {
+            "response": response.final_output,
+            "context": context + [context_item]
+        }
+
+    except Exception as e:
+        print(f"Error in chat processing: {e}")
+        return {
+            "response": {"error": f"An error occurred while processing your request: {str(e)}"},
+            "context": user_input_data.get('context', [])
+        }
+
+async def chat_stream(user_input_data):
+    """
+    Same as chat, but streams the reply of the final agent as it is generated.
+    
+    Yields:
+        (event, data) tuples:
+        - ("metadata", {"agent": name}) once the specialist analysis is done
+        - ("token", text) for every piece of the reply
+        - ("done", {"context": updated_context}), plus "session" for session requests
+        - ("error", {"error": message, "context": context}) if anything fails
+    """
+    try:
+        session, user_input_data = await open_session(user_input_data)
+        chat_input = user_input_data.get('chatInput', '')
+        context = user_input_data.get('context', [])
         
-        # Check if detailed analysis is explicitly requested
-        if requires_analysis(chat_input):
-            print("User explicitly requested analysis")
-        else:
-            print("No explicit analysis request - defaulting to content analysis since HTML/screenshot provided")
-            # Since frontend always provides content, default to analysis for non-generic queries
-        
-        # Collect analysis results from specialist agents
-        analysis_results = []
-        
-        # Analyze HTML content (always provided by frontend)
-        if html_content:
-            print("Analyzing HTML content...")
-            html_context = f"{context_string}User Query: {chat_input}\n\nHTML Content:\n{html_content}"
-            html_analysis = await Runner.run(html_agent, html_context)
-            analysis_results.append(f"HTML Analysis:\n{html_analysis.final_output}")
+        agent, agent_input, label = await prepare_final_run(user_input_data)
+        yield "metadata", {"agent": agent.name}
         
-        # Analyze image content (always provided by frontend)
-        if screenshot:
-            print("Analyzing image content...")
-            image_context = f"{context_string}User Query: {chat_input}\n\nPlease analyze the provided screenshot/image for business insights, UI elements, charts, graphs, or any visual data that could help a seller improve their business operations."
-            
-            if screenshot.startswith('data:image'):
-                image_context += f"\n\nImage provided: {screenshot[:100]}... (base64 encoded image)"
-            
-            image_analysis = await Runner.run(image_reader_agent, image_context)
-            analysis_results.append(f"Image Analysis:\n{image_analysis.final_output}")
+        result = Runner.run_streamed(agent, agent_input)
+        async for event in result.stream_events():
+            if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                yield "token", event.data.delta
         
-        # Generate seller summary from analysis results
-        if analysis_results:
-            print("Generating seller summary...")
-            summary_context = f"{context_string}User Query: {chat_input}\n\n" + "\n\n".join(analysis_results)
-            summary_context += "\n\nPlease provide a comprehensive business summary in simple terms that helps the seller understand their page/content and how to improve their sales."
-            
-            final_summary = await Runner.run(seller_summary_agent, summary_context)
-            
-            # Add to context and return
-            new_context_item = f"User: {chat_input} | Analysis: {final_summary.final_output[:200]}..." if len(final_summary.final_output) > 200 else f"User: {chat_input} | Analysis: {final_summary.final_output}"
-            updated_context = context + [new_context_item]
-            
-            return {
-                "response": final_summary.final_output,
-                "context": updated_context
-            }
+        context_item = build_context_item(chat_input, label, result.final_output)
+        if session:
+            session_info = await close_session(session, context_item)
+            yield "done", {"context": session.context_items(), "session": session_info}
         else:
-            # Fallback if no content to analyze (shouldn't happen with frontend)
-            print("No content to analyze - using generic response")
-            full_input = f"{context_string}Current User Input: {chat_input or 'Hello! How can I help you with your business today?'}"
-            response = await Runner.run(generic_chat_agent, full_input)
-            
-            # Add to context and return
-            new_context_item = f"User: {chat_input} | Assistant: {response.final_output}"
-            updated_context = context + [new_context_item]
-            
-            return {
-                "response": response.final_output,
-                "context": updated_context
-            }
+            yield "done", {"context": context + [context_item]}
 
     except Exception as e:
         print(f"Error in chat processing: {e}")
-        return {
-            "response": {"error": f"An error occurred while processing your request: {str(e)}"},
+        yield "error", {
+            "error": f"An error occurred while processing your request: {str(e)}",
             "context": user_input_data.get('context', [])
         }
 
@@ -0,0 +1,125 @@
+import os
+import re
+from langchain_core.documents import Document
+from utils import count_tokens, get_tokenizer
+
+# Maximum tokens per chunk, including the short component/section header
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+# Tokens repeated at the start of a chunk, only when a section had to be split
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+class SectionChunker:
+    """
+    Structure-aware splitter for scraped component pages
+
+    The description, every code block and every props table become their own
+    chunks. Sizes are measured in tokens; a section larger than the budget is
+    split on sentence (description) or line (code, tables) boundaries, and only
+    those continuation chunks carry overlap. Continued tables repeat their header
+    row instead of overlapping.
+
+    Has the same `split_documents` interface as the langchain text splitters.
+
+    Args:
+        max_tokens: Token budget per chunk
+        overlap_tokens: Overlap used when a section is split mid-way
+    """
+
+    def __init__(self, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    @property
+    def fingerprint(self):
+        return f"section-chunker:{self.max_tokens}:{self.overlap_tokens}"
+
+    def split_documents(self, documents):
+        chunks = []
+        for document in documents:
+            chunks.extend(self.split_document(document))
+        return chunks
+
+    def split_document(self, document):
+        metadata = {key: value for key, value in document.metadata.items() if key != "sections"}
+        sections = document.metadata.get("sections")
+        if sections is None:
+            # Page scraped before sections were captured, chunk it as a single section
+            sections = {"description": document.page_content, "code_examples": [], "api_props": []}
+
+        parts = [("description", "DESCRIPTION", sections.get("description", ""))]
+        parts += [("code_example", f"CODE EXAMPLE {i}", code) for i, code in enumerate(sections.get("code_examples", []), 1)]
+        parts += [("api_props", f"API PROPS {i}", table) for i, table in enumerate(sections.get("api_props", []), 1)]
+
+        chunks = []
+        for section, label, text in parts:
+            if not text or not text.strip():
+                continue
+            header = f"Component: {metadata.get('component_name')}\nSECTION: {label}\n"
+            budget = max(1, self.max_tokens - count_tokens(header))
+            for piece in self.split_section(section, text.strip(), budget):
+                chunks.append(Document(page_content=header + piece, metadata={**metadata, "section": section}))
+        return chunks
+
+    # Function to split one section into pieces of at most `budget` tokens
+    def split_section(self, section, text, budget):
+        if count_tokens(text) <= budget:
+            return [text]
+
+        if section == "description":
+            units, joiner = SENTENCE_BOUNDARY.split(text), " "
+        else:
+            units, joiner = text.splitlines(), "\n"
+
+        # Break any single unit that is over budget on its own
+        sized_units = []
+        for unit in units:
+            tokens = count_tokens(unit)
+            if tokens <= budget:
+                sized_units.append((unit, tokens))
+            else:
+                sized_units.extend((piece, count_tokens(piece)) for piece in self.split_tokens(unit, budget))
+
+        # Tables repeat their header row in each continuation instead of overlapping
+        table_header = sized_units[0] if section == "api_props" and sized_units else None
+
+        pieces = []
+        current, current_tokens = [], 0
+        for unit, tokens in sized_units:
+            if current and current_tokens + tokens > budget:
+                pieces.append(joiner.join(u for u, _ in current))
+                current, current_tokens = self.carry_over(current, table_header, budget - tokens)
+            current.append((unit, tokens))
+            current_tokens += tokens
+        if current:
+            pieces.append(joiner.join(u for u, _ in current))
+        return pieces
+
+    # Function to pick the units that start the next chunk after a mid-section split
+    def carry_over(self, previous, table_header, room):
+        if table_header:
+            if table_header[1] <= room:
+                return [table_header], table_header[1]
+            return [], 0
+
+        carried, carried_tokens = [], 0
+        for unit, tokens in reversed(previous):
+            if carried_tokens + tokens > min(self.overlap_tokens, room):
+                break
+            carried.insert(0, (unit, tokens))
+            carried_tokens += tokens
+        return carried, carried_tokens
+
+    # Function to hard-split text on token boundaries
+    def split_tokens(self, text, budget):
+        tokenizer = get_tokenizer()
+        tokens = tokenizer.encode(text, disallowed_special=())
+        step = max(1, budget - self.overlap_tokens)
+        pieces = []
+        start = 0
+        while True:
+            pieces.append(tokenizer.decode(tokens[start:start + budget]))
+            if start + budget >= len(tokens):
+                return pieces
+            start += step
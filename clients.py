@@ -0,0 +1,142 @@
+import os
+import atexit
+import threading
+import httpx
+from dotenv import load_dotenv
+from openai import OpenAI, AsyncOpenAI
+from qdrant_client import QdrantClient
+
+# Load environment variables
+load_dotenv()
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+# Use gRPC (port QDRANT_GRPC_PORT) for Qdrant calls instead of REST
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "10"))
+
+# Keep-alive pool shared by every HTTP client in the process
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "120"))
+
+_clients = {}
+# Reentrant: the OpenAI factories create their HTTP client through the registry
+_lock = threading.RLock()
+
+def get_http_limits():
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+
+# Function to create a client once and hand out the same instance afterwards
+def _get_or_create(key, factory):
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = factory()
+                _clients[key] = client
+    return client
+
+def get_qdrant_client():
+    """
+    Long-lived Qdrant client with a keep-alive pool (or gRPC when QDRANT_PREFER_GRPC=true)
+    """
+    return _get_or_create("qdrant", lambda: QdrantClient(
+        url=QDRANT_URL,
+        prefer_grpc=QDRANT_PREFER_GRPC,
+        grpc_port=QDRANT_GRPC_PORT,
+        timeout=QDRANT_TIMEOUT,
+        limits=get_http_limits()
+    ))
+
+def get_http_client(verify=True):
+    """
+    Pooled synchronous HTTP client for OpenAI calls
+
+    Args:
+        verify: Verify TLS certificates (some callers disable it for corporate proxies)
+    """
+    return _get_or_create(("http", verify), lambda: httpx.Client(
+        verify=verify,
+        limits=get_http_limits(),
+        timeout=HTTP_TIMEOUT
+    ))
+
+def get_async_http_client(verify=True):
+    return _get_or_create(("async_http", verify), lambda: httpx.AsyncClient(
+        verify=verify,
+        limits=get_http_limits(),
+        timeout=HTTP_TIMEOUT
+    ))
+
+def get_openai_client(verify=True):
+    return _get_or_create(("openai", verify), lambda: OpenAI(
+        api_key=os.getenv("OPEN_API_KEY"),
+        http_client=get_http_client(verify)
+    ))
+
+def get_async_openai_client(verify=True):
+    return _get_or_create(("async_openai", verify), lambda: AsyncOpenAI(
+        api_key=os.getenv("OPEN_API_KEY"),
+        http_client=get_async_http_client(verify)
+    ))
+
+# Function to check that the shared clients can reach their services
+def check_health(include_qdrant=True):
+    """
+    Args:
+        include_qdrant: Whether queries need Qdrant (not with the embedded retrieval backend)
+
+    Returns:
+        A dictionary of service name to {"ok": bool, "error": str}
+    """
+    health = {}
+    if include_qdrant:
+        try:
+            get_qdrant_client().get_collections()
+            health["qdrant"] = {"ok": True}
+        except Exception as e:
+            health["qdrant"] = {"ok": False, "error": str(e)}
+
+    if not os.getenv("OPEN_API_KEY"):
+        health["openai"] = {"ok": False, "error": "OPEN_API_KEY not set"}
+    else:
+        try:
+            get_openai_client().models.list()
+            health["openai"] = {"ok": True}
+        except Exception as e:
+            health["openai"] = {"ok": False, "error": str(e)}
+    return health
+
+# Function to close every client created by the registry
+def close_clients():
+    with _lock:
+        clients = list(_clients.items())
+        _clients.clear()
+    for key, client in clients:
+        try:
+            if isinstance(client, (httpx.AsyncClient, AsyncOpenAI)):
+                # Async clients are closed by aclose_clients on their event loop
+                continue
+            client.close()
+        except Exception as e:
+            print(f"Error closing client {key}: {str(e)}")
+
+async def aclose_clients():
+    with _lock:
+        async_clients = [(key, client) for key, client in _clients.items() if isinstance(client, (httpx.AsyncClient, AsyncOpenAI))]
+        for key, _ in async_clients:
+            del _clients[key]
+    for key, client in async_clients:
+        try:
+            await client.close() if isinstance(client, AsyncOpenAI) else await client.aclose()
+        except Exception as e:
+            print(f"Error closing client {key}: {str(e)}")
+
+atexit.register(close_clients)
@@ -0,0 +1,284 @@
+import os
+import json
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from urllib.parse import urljoin, urlparse, urlunparse
+import requests
+from bs4 import BeautifulSoup
+from fetcher import get_http_session, STATIC_FETCH_TIMEOUT
+
+# Number of pages fetched concurrently during discovery
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", "4"))
+# Minimum seconds between two requests to the same host
+CRAWL_DELAY = float(os.getenv("CRAWL_DELAY", "0.2"))
+# Upper bound on pages visited in one crawl
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "500"))
+# ETag/Last-Modified validators and discovered links, kept between runs
+CRAWL_STATE_PATH = os.getenv("CRAWL_STATE_PATH", "crawl_state.json")
+
+# Function to normalize a URL so the frontier does not visit duplicates
+def normalize_url(url):
+    parsed = urlparse(url)
+    path = parsed.path.rstrip("/") or "/"
+    return urlunparse((parsed.scheme, parsed.netloc.lower(), path, "", "", ""))
+
+class CrawlState:
+    """
+    Per-URL conditional fetch validators persisted as JSON between runs
+
+    Validators of a page fetched in full are only staged; they are committed
+    once the page has been indexed, so a page whose scrape, embed or upsert
+    failed is fetched in full again on the next run instead of answering 304.
+    """
+
+    def __init__(self, path=CRAWL_STATE_PATH):
+        self.path = path
+        self.staged = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r") as f:
+                self.pages = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.pages = {}
+
+    def get(self, url):
+        with self._lock:
+            return self.pages.get(url, {})
+
+    def update(self, url, **fields):
+        with self._lock:
+            self.pages.setdefault(url, {}).update(fields)
+
+    def stage(self, url, **validators):
+        with self._lock:
+            self.staged[url] = validators
+
+    # Function to keep the staged validators of a page, plus e.g. the index version it was indexed with
+    def commit(self, url, **fields):
+        with self._lock:
+            self.pages.setdefault(url, {}).update(self.staged.pop(url, {}), **fields)
+
+    # Function to drop what is known about a page, so the next run fetches it in full
+    def forget(self, url):
+        with self._lock:
+            self.pages.pop(url, None)
+            self.staged.pop(url, None)
+
+    def save(self):
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.pages, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+class HostThrottle:
+    """
+    Spaces out requests to the same host by at least `delay` seconds
+    """
+
+    def __init__(self, delay=CRAWL_DELAY):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._next_allowed = {}
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_allowed.get(host, now))
+            self._next_allowed[host] = slot + self.delay
+        if slot > now:
+            time.sleep(slot - now)
+
+class CrawlResult:
+    def __init__(self, state=None):
+        self.state = state  # CrawlState to commit indexed pages to
+        self.pages = []  # every page URL discovered in scope
+        self.unchanged = set()  # pages that answered 304 Not Modified
+        self.failed = set()
+        self.truncated = False  # max_pages was reached before every link was followed
+
+    @property
+    def complete(self):
+        # Every page in scope was reached, so a page missing from pages is gone from the site
+        return not self.failed and not self.truncated
+
+class Crawler:
+    """
+    Concurrent, polite crawler for discovering documentation pages
+
+    Seeds the frontier from the start URLs and the site's sitemap(s), then follows
+    same-host links breadth first. Each page is fetched with If-None-Match /
+    If-Modified-Since from the persisted state, so an unchanged page costs a 304
+    and its previously discovered links are reused. New validators only take
+    effect once committed to the state (see CrawlState).
+
+    Args:
+        allowed_host: Only URLs on this host are crawled
+        render: Optional callable(url) -> html used when static HTML has no links
+        state: CrawlState holding validators from previous runs
+        workers: Pages fetched concurrently
+        max_pages: Upper bound on pages visited
+    """
+
+    def __init__(self, allowed_host, render=None, state=None, workers=CRAWL_WORKERS, max_pages=CRAWL_MAX_PAGES):
+        self.allowed_host = allowed_host
+        self.render = render
+        self.state = state or CrawlState()
+        self.workers = max(1, workers)
+        self.max_pages = max_pages
+        self.throttle = HostThrottle()
+
+    def in_scope(self, url):
+        parsed = urlparse(url)
+        return parsed.scheme in ("http", "https") and self.allowed_host in parsed.netloc
+
+    def _get(self, url, headers=None):
+        self.throttle.wait(url)
+        return get_http_session().get(url, headers=headers or {}, timeout=STATIC_FETCH_TIMEOUT)
+
+    # Function to collect page URLs from robots.txt sitemaps and /sitemap.xml
+    def sitemap_urls(self, start_url):
+        parsed = urlparse(start_url)
+        root = f"{parsed.scheme}://{parsed.netloc}"
+        sitemaps = deque([f"{root}/sitemap.xml"])
+        try:
+            robots = self._get(f"{root}/robots.txt")
+            if robots.status_code == 200:
+                for line in robots.text.splitlines():
+                    if line.lower().startswith("sitemap:"):
+                        sitemaps.appendleft(line.split(":", 1)[1].strip())
+        except requests.RequestException:
+            pass
+
+        found = []
+        visited = set()
+        while sitemaps:
+            sitemap_url = sitemaps.popleft()
+            if sitemap_url in visited:
+                continue
+            visited.add(sitemap_url)
+            try:
+                response = self._get(sitemap_url)
+                if response.status_code != 200:
+                    continue
+                tree = ET.fromstring(response.content)
+            except (requests.RequestException, ET.ParseError):
+                continue
+            for element in tree.iter():
+                if element.tag.endswith("loc") and element.text:
+                    loc = element.text.strip()
+                    # A sitemap index points at more sitemaps
+                    if tree.tag.endswith("sitemapindex"):
+                        sitemaps.append(loc)
+                    elif self.in_scope(loc):
+                        found.append(normalize_url(loc))
+        if found:
+            print(f"Sitemaps listed {len(found)} pages")
+        return found
+
+    def extract_page_links(self, html, page_url):
+        soup = BeautifulSoup(html, "html.parser")
+        links = set()
+        for a_tag in soup.find_all('a', href=True):
+            full_url = urljoin(page_url, a_tag['href'])
+            if self.in_scope(full_url):
+                links.add(normalize_url(full_url))
+        links.discard(page_url)
+        return sorted(links)
+
+    # Function to fetch one page conditionally and return the links found on it
+    def visit(self, url):
+        """
+        Returns:
+            A tuple of (status, links) where status is "modified", "unchanged" or "failed"
+        """
+        previous = self.state.get(url)
+        headers = {}
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+        try:
+            response = self._get(url, headers=headers)
+        except requests.RequestException as e:
+            print(f"Error crawling {url}: {str(e)}")
+            return "failed", previous.get("links", [])
+
+        if response.status_code == 304 and "links" in previous:
+            return "unchanged", previous["links"]
+        if response.status_code != 200:
+            print(f"Crawling {url} returned HTTP {response.status_code}")
+            return "failed", previous.get("links", [])
+
+        links = self.extract_page_links(response.text, url)
+        if not links and self.render:
+            # Client-side rendered page, links only exist after JavaScript runs
+            try:
+                links = self.extract_page_links(self.render(url), url)
+            except Exception as e:
+                print(f"Error rendering {url} for links: {str(e)}")
+
+        self.state.update(url, links=links, fetched_at=datetime.now().isoformat())
+        self.state.stage(url, etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"))
+        return "modified", links
+
+    def crawl(self, start_urls, use_sitemap=True):
+        """
+        Crawl from the start URLs (and sitemaps) and persist discovered links for the next run
+
+        Returns:
+            A CrawlResult with every in-scope page and which of them were
+            unchanged; validators of changed pages stay staged in its state
+            until they are committed
+        """
+        result = CrawlResult(self.state)
+        seen = set()
+        frontier = deque()
+
+        def enqueue(url):
+            url = normalize_url(url)
+            if url in seen or not self.in_scope(url):
+                return
+            if len(seen) >= self.max_pages:
+                result.truncated = True
+                return
+            seen.add(url)
+            frontier.append(url)
+
+        for url in start_urls:
+            enqueue(url)
+        if use_sitemap and start_urls:
+            for url in self.sitemap_urls(start_urls[0]):
+                enqueue(url)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = {}
+            while frontier or in_flight:
+                while frontier and len(in_flight) < self.workers:
+                    url = frontier.popleft()
+                    in_flight[executor.submit(self.visit, url)] = url
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = in_flight.pop(future)
+                    status, links = future.result()
+                    if status == "failed":
+                        result.failed.add(url)
+                    else:
+                        result.pages.append(url)
+                        if status == "unchanged":
+                            result.unchanged.add(url)
+                    for link in links:
+                        enqueue(link)
+
+        self.state.save()
+        print(
+            f"Crawled {len(result.pages)} pages ({len(result.unchanged)} unchanged, "
+            f"{len(result.failed)} failed) from {len(seen)} discovered URLs"
+        )
+        return result
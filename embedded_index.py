@@ -0,0 +1,149 @@
+import os
+import json
+import threading
+import numpy as np
+from langchain_core.documents import Document
+
+# Vectors are saved to <prefix>.npy and their payloads to <prefix>.json
+EMBEDDED_INDEX_PATH = os.getenv("EMBEDDED_INDEX_PATH", "embedded_index")
+
+# Export the snapshot at every ingest even while queries use Qdrant (it is also
+# refreshed whenever one exists already, so a server using it never reads a stale one)
+EMBEDDED_INDEX_EXPORT = os.getenv("EMBEDDED_INDEX_EXPORT", "false").lower() == "true"
+
+# Function to tell whether an ingest should (re)write the embedded index
+def should_export_embedded_index(embedded_backend, path=EMBEDDED_INDEX_PATH):
+    return embedded_backend or EMBEDDED_INDEX_EXPORT or os.path.exists(f"{path}.json")
+
+# Function to export every stored vector and payload into a memory-mappable snapshot
+def export_embedded_index(chunks, path=EMBEDDED_INDEX_PATH):
+    """
+    Write the stored chunks into one normalized float32 matrix
+
+    Rows are grouped by collection, so each collection is a contiguous slice
+    of the matrix. The matrix is written through np.lib.format.open_memmap;
+    the payload file is replaced last, which is what readers watch for a new
+    snapshot.
+
+    Args:
+        chunks: StoredChunks from indexing.scan_stored_chunks, grouped by collection
+
+    Returns:
+        The number of exported vectors
+    """
+    if not chunks:
+        print("No stored vectors found, embedded index not exported")
+        return 0
+
+    vectors_tmp_path = f"{path}.npy.tmp"
+    matrix = np.lib.format.open_memmap(vectors_tmp_path, mode="w+", dtype=np.float32, shape=(len(chunks), len(chunks[0].vector)))
+    rows = []
+    collections = {}
+    for chunk in chunks:
+        vector = np.asarray(chunk.vector, dtype=np.float32)
+        matrix[len(rows)] = vector / max(np.linalg.norm(vector), 1e-12)
+        start, _ = collections.get(chunk.collection_name, (len(rows), None))
+        rows.append({"page_content": chunk.page_content, "metadata": chunk.metadata})
+        collections[chunk.collection_name] = [start, len(rows)]
+    matrix.flush()
+    del matrix
+
+    payloads_tmp_path = f"{path}.json.tmp"
+    with open(payloads_tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"rows": rows, "collections": collections}, f, ensure_ascii=False)
+    os.replace(vectors_tmp_path, f"{path}.npy")
+    os.replace(payloads_tmp_path, f"{path}.json")
+    print(f"Exported {len(rows)} vectors of {len(collections)} collections to {path}.npy")
+    return len(rows)
+
+class EmbeddedIndex:
+    """
+    Exact cosine search over the exported snapshot, without a Qdrant round trip
+
+    The matrix is memory-mapped read-only, so every worker process searching
+    the same snapshot shares one copy of it in the page cache.
+
+    Args:
+        path: Prefix of the exported .npy and .json files
+    """
+
+    def __init__(self, path=EMBEDDED_INDEX_PATH):
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            exported = json.load(f)
+        self.rows = exported["rows"]
+        self.collections = exported["collections"]
+        self.matrix = np.load(f"{path}.npy", mmap_mode="r")
+        if self.matrix.shape[0] < len(self.rows):
+            raise ValueError(f"Embedded index at {path} is incomplete: {self.matrix.shape[0]} vectors for {len(self.rows)} payloads")
+        self.component_names = np.array([row["metadata"].get("component_name") or "" for row in self.rows])
+
+    def has_collection(self, collection_name):
+        return collection_name in self.collections
+
+    def search(self, collection_name, query_vector, k=2, component_filter=None):
+        """
+        Args:
+            collection_name: Collection whose vectors are searched
+            query_vector: Embedding of the query
+            k: Number of results
+            component_filter: Only return chunks of these components, when given
+
+        Returns:
+            Up to k Documents sorted by descending cosine score, with "score"
+            and "collection" in their metadata, like the Qdrant search
+        """
+        if collection_name not in self.collections:
+            return None
+        start, end = self.collections[collection_name]
+        query = np.asarray(query_vector, dtype=np.float32)
+        if query.shape[0] != self.matrix.shape[1]:
+            raise ValueError(f"Query has {query.shape[0]} dimensions, the embedded index {self.matrix.shape[1]}")
+        scores = self.matrix[start:end] @ (query / max(np.linalg.norm(query), 1e-12))
+        if component_filter:
+            scores = np.where(np.isin(self.component_names[start:end], list(component_filter)), scores, -np.inf)
+
+        k = min(k, end - start)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            Document(
+                page_content=self.rows[start + i]["page_content"],
+                metadata={**self.rows[start + i]["metadata"], "score": float(scores[i]), "collection": collection_name}
+            )
+            for i in top if np.isfinite(scores[i])
+        ]
+
+class EmbeddedIndexLoader:
+    """
+    Opens the exported snapshot lazily and reopens it when an ingest exports a new one
+    """
+
+    def __init__(self, path=EMBEDDED_INDEX_PATH):
+        self.path = path
+        self.index = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(f"{self.path}.json")
+            except OSError:
+                return None
+            if mtime != self._mtime:
+                try:
+                    self.index = EmbeddedIndex(self.path)
+                except (OSError, ValueError) as e:
+                    # Caught between the two file replacements, keep the previous snapshot
+                    print(f"Error loading embedded index, keeping the previous one: {str(e)}")
+                    return self.index
+                self._mtime = mtime
+                print(f"Loaded embedded index of {len(self.index.rows)} vectors")
+            return self.index
+
+_loader = EmbeddedIndexLoader()
+
+def get_embedded_index():
+    return _loader.get()
@@ -0,0 +1,73 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils import count_tokens
+
+# Token budget for a single embedding request
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "16000"))
+# OpenAI accepts at most 2048 inputs per embedding request
+EMBED_BATCH_MAX_INPUTS = int(os.getenv("EMBED_BATCH_MAX_INPUTS", "2048"))
+# Number of embedding requests in flight at once
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+# Function to pack texts into batches that stay under a token budget
+def pack_batches(texts, token_budget=EMBED_BATCH_TOKENS, max_inputs=EMBED_BATCH_MAX_INPUTS, token_counts=None):
+    """
+    Group text indexes into batches of at most `token_budget` tokens
+
+    A text larger than the budget on its own still gets a batch of its own.
+
+    Args:
+        token_counts: Already known token count of every text, to skip counting them again
+
+    Returns:
+        A list of (indexes, token_count) tuples
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for index, text in enumerate(texts):
+        tokens = token_counts[index] if token_counts is not None else count_tokens(text)
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_inputs):
+            batches.append((current, current_tokens))
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        batches.append((current, current_tokens))
+    return batches
+
+# Function to embed many texts with token-budgeted batches dispatched concurrently
+def embed_texts(texts, embeddings, token_budget=EMBED_BATCH_TOKENS, concurrency=EMBED_CONCURRENCY):
+    """
+    Embed texts in token-budgeted batches, at most `concurrency` requests at a time
+
+    Args:
+        texts: Texts to embed, possibly from many components
+        embeddings: langchain Embeddings used for each batch
+        token_budget: Maximum tokens per request
+        concurrency: Maximum requests in flight
+
+    Returns:
+        A list of vectors in the same order as `texts`
+    """
+    if not texts:
+        return []
+
+    batches = pack_batches(texts, token_budget)
+    total_tokens = sum(tokens for _, tokens in batches)
+    print(f"Embedding {len(texts)} chunks ({total_tokens} tokens) in {len(batches)} batches, {concurrency} in parallel")
+
+    vectors = [None] * len(texts)
+    started = time.monotonic()
+
+    def embed_batch(indexes):
+        return indexes, embeddings.embed_documents([texts[i] for i in indexes])
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for indexes, batch_vectors in executor.map(embed_batch, [indexes for indexes, _ in batches]):
+            for index, vector in zip(indexes, batch_vectors):
+                vectors[index] = vector
+
+    elapsed = time.monotonic() - started
+    print(f"Embedded {total_tokens} tokens in {elapsed:.2f}s ({total_tokens / max(elapsed, 1e-6):.0f} tokens/s)")
+    return vectors
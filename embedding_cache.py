@@ -0,0 +1,194 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from clients import get_http_client
+
+# Load environment variables
+load_dotenv()
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Leading dimensions kept of every vector (Matryoshka truncation); 0 keeps all of them
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+# Maximum number of cached vectors before least recently used ones are evicted
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# SQLite caps the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+# Function to shorten a Matryoshka embedding to its leading dimensions, re-normalized
+def truncate_embedding(vector, dimensions):
+    if not dimensions or len(vector) <= dimensions:
+        return vector
+    head = np.asarray(vector[:dimensions], dtype=np.float32)
+    return (head / max(np.linalg.norm(head), 1e-12)).tolist()
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed on-disk cache in front of an embedding model
+
+    Vectors are stored in SQLite keyed by a hash of the model name and the text,
+    so ingest and query processes share them. Once the cache holds more than
+    `max_entries` vectors the least recently used ones are evicted. Full-length
+    vectors are cached and truncated on the way out, so changing `dimensions`
+    does not need any new embedding calls.
+
+    Args:
+        embeddings: The underlying langchain Embeddings to call on a miss
+        model_name: Name folded into every cache key
+        path: SQLite database file
+        max_entries: Size bound for eviction
+        dimensions: Leading dimensions returned of every vector, or 0 for all
+    """
+
+    def __init__(self, embeddings, model_name, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES, dimensions=EMBEDDING_DIMENSIONS):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.dimensions = dimensions
+        # Identifies the stored vectors; a different length invalidates every indexed chunk
+        self.fingerprint = f"{model_name}:{dimensions}" if dimensions else model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys):
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key, _ in rows]
+                    )
+            self._conn.commit()
+        return found
+
+    def _store(self, items):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                [
+                    (key, self.model_name, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for key, vector in items
+                ]
+            )
+            self._evict()
+            self._conn.commit()
+
+    # Drop the least recently used tenth once the cache is over its size bound
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+        print(f"Evicted {excess} entries from embedding cache")
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(keys)
+
+        # Embed each missing text once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        miss_count = sum(1 for key in keys if key not in cached)
+        with self._lock:
+            self.hits += len(texts) - miss_count
+            self.misses += miss_count
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self._store(fresh.items())
+            cached.update(fresh)
+
+        return [truncate_embedding(cached[key], self.dimensions) for key in keys]
+
+    def embed_query(self, text):
+        key = self._key(text)
+        cached = self._lookup([key])
+        if key in cached:
+            with self._lock:
+                self.hits += 1
+            return truncate_embedding(cached[key], self.dimensions)
+
+        with self._lock:
+            self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self._store([(key, vector)])
+        return truncate_embedding(vector, self.dimensions)
+
+    # Function to get the length of the vectors this instance returns
+    def vector_size(self):
+        if self.dimensions:
+            return self.dimensions
+        # The model's native length; the probe is embedded once and then served from the cache
+        return len(self.embed_query("Appliqué"))
+
+    def stats(self):
+        total = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries
+        }
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+# Function to get the process-wide cached embeddings used by ingest and query
+def get_embeddings():
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            _embeddings = CachedEmbeddings(
+                OpenAIEmbeddings(
+                    model=EMBEDDING_MODEL,
+                    api_key=os.getenv("OPEN_API_KEY"),
+                    http_client=get_http_client()
+                ),
+                model_name=EMBEDDING_MODEL
+            )
+        return _embeddings
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+import requests
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+# Maximum wall-clock seconds spent rendering a single page in the browser
+PAGE_TIME_BUDGET = float(os.getenv("PAGE_TIME_BUDGET", "15"))
+# Timeout for the plain HTTP fast path
+STATIC_FETCH_TIMEOUT = float(os.getenv("STATIC_FETCH_TIMEOUT", "10"))
+# The DOM is considered settled once it stops changing for this long
+DOM_SETTLE_QUIET = float(os.getenv("DOM_SETTLE_QUIET", "0.5"))
+DOM_SETTLE_POLL = 0.1
+
+USER_AGENT = "Mozilla/5.0 (compatible; AppliqueRAG/1.0)"
+
+# requests.Session is not guaranteed to be thread safe, keep one per scraping thread
+_thread_local = threading.local()
+
+def get_http_session():
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update({"User-Agent": USER_AGENT})
+        _thread_local.session = session
+    return session
+
+# Function to check that a page has every section the component scraper extracts
+def has_component_content(page_source):
+    """
+    Return True when the HTML already contains the main text, code blocks and
+    props tables, i.e. nothing is waiting on client-side rendering
+    """
+    soup = BeautifulSoup(page_source, "html.parser")
+    main_content = soup.find('main')
+    if not main_content or not main_content.get_text(strip=True):
+        return False
+    if not any(pre.get_text(strip=True) for pre in soup.find_all('pre')):
+        return False
+    if not any(table.get_text(strip=True) for table in soup.find_all('table')):
+        return False
+    return True
+
+# Function to fetch a page over plain HTTP without running any JavaScript
+def fetch_static(url, timeout=STATIC_FETCH_TIMEOUT):
+    try:
+        response = get_http_session().get(url, timeout=timeout)
+        if response.status_code != 200:
+            print(f"Static fetch of {url} returned HTTP {response.status_code}")
+            return None
+        if "html" not in response.headers.get("Content-Type", "html"):
+            return None
+        return response.text
+    except requests.RequestException as e:
+        print(f"Static fetch of {url} failed: {str(e)}")
+        return None
+
+# Function to wait until the DOM stops changing or the deadline passes
+def wait_for_dom_settle(driver, deadline, quiet=DOM_SETTLE_QUIET):
+    last_size = None
+    stable_since = time.monotonic()
+    while time.monotonic() < deadline:
+        size = driver.execute_script(
+            "return document.getElementsByTagName('*').length + "
+            "(document.body ? document.body.innerText.length : 0);"
+        )
+        now = time.monotonic()
+        if size != last_size:
+            last_size = size
+            stable_since = now
+        elif now - stable_since >= quiet:
+            return True
+        time.sleep(DOM_SETTLE_POLL)
+    return False
+
+# Function to render a page in a pooled browser, waiting for readiness instead of sleeping
+def render_page(pool, url, ready_selector="main", budget=PAGE_TIME_BUDGET):
+    """
+    Load a page in the browser pool and return its HTML once it is ready
+
+    The page is ready when `ready_selector` is present and the DOM has settled.
+    Whatever has rendered is returned when the time budget runs out.
+    """
+    def load(driver):
+        deadline = time.monotonic() + budget
+        driver.set_page_load_timeout(budget)
+        try:
+            driver.get(url)
+        except TimeoutException:
+            print(f"Page load of {url} exceeded {budget}s budget")
+            return driver.page_source
+
+        try:
+            remaining = max(0.1, deadline - time.monotonic())
+            WebDriverWait(driver, remaining).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, ready_selector))
+            )
+        except TimeoutException:
+            print(f"'{ready_selector}' did not appear on {url} within {budget}s")
+            return driver.page_source
+
+        if not wait_for_dom_settle(driver, deadline):
+            print(f"DOM of {url} still changing at the {budget}s budget, using current state")
+        return driver.page_source
+
+    return pool.run(load)
+
+# Function to fetch a page with the static fast path and a rendered-browser fallback
+def fetch_page(url, pool, is_complete=has_component_content, budget=PAGE_TIME_BUDGET):
+    """
+    Fetch a page's HTML as cheaply as possible
+
+    Args:
+        url: Page to fetch
+        pool: BrowserPool used when the static HTML is incomplete
+        is_complete: Callable deciding whether the static HTML has the content we need
+        budget: Per-page time budget for the browser fallback
+
+    Returns:
+        A tuple of (html, method) where method is "static" or "browser"
+    """
+    page_source = fetch_static(url)
+    if page_source and is_complete(page_source):
+        return page_source, "static"
+    return render_page(pool, url, budget=budget), "browser"
@@ -0,0 +1,133 @@
+import os
+import re
+from bs4 import BeautifulSoup, Comment
+from utils import count_tokens, get_tokenizer
+
+# Token budget for the reduced HTML handed to the html agent
+HTML_MAX_TOKENS = int(os.getenv("HTML_MAX_TOKENS", "6000"))
+# Repeated rows / list items kept as samples before the rest are summarized by a count
+HTML_SAMPLE_ROWS = int(os.getenv("HTML_SAMPLE_ROWS", "5"))
+
+# Never carry meaning for the agent
+DROPPED_TAGS = ["script", "style", "noscript", "svg", "template", "iframe", "canvas", "link", "meta", "head", "object", "embed", "video", "audio", "source", "picture"]
+# Kept as tags; everything else is unwrapped into its children
+SEMANTIC_TAGS = {
+    "h1", "h2", "h3", "h4", "h5", "h6", "p", "a", "nav", "header", "footer", "main", "section", "article", "aside",
+    "ul", "ol", "li", "dl", "dt", "dd", "table", "thead", "tbody", "tfoot", "tr", "th", "td", "caption",
+    "form", "fieldset", "legend", "label", "input", "select", "option", "textarea", "button", "img", "dialog"
+}
+KEPT_ATTRIBUTES = {"href", "name", "type", "placeholder", "value", "alt", "title", "aria-label", "role", "checked", "selected", "disabled"}
+# Parents whose children are collapsed into samples, and the child tag that repeats
+REPEATED_CHILDREN = {"tbody": "tr", "table": "tr", "thead": "tr", "ul": "li", "ol": "li", "select": "option", "dl": "dt"}
+
+HIDDEN_STYLE = re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden")
+WHITESPACE = re.compile(r"\s+")
+BETWEEN_TAGS = re.compile(r">\s+<")
+COLLAPSED_NOTE = re.compile(r"^\.\.\. (\d+) more (?:rows|items)$")
+
+# Function to remove markup that carries no meaning for the agent
+def strip_markup(soup):
+    for tag in soup(DROPPED_TAGS):
+        tag.decompose()
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.extract()
+
+    for tag in soup.find_all(True):
+        if tag.decomposed:
+            continue
+        if tag.has_attr("hidden") or tag.get("aria-hidden") == "true" or HIDDEN_STYLE.search(tag.get("style", "")):
+            tag.decompose()
+            continue
+        if tag.name == "img" and not tag.get("alt"):
+            tag.decompose()
+            continue
+        tag.attrs = {
+            key: value for key, value in tag.attrs.items()
+            if key in KEPT_ATTRIBUTES and value not in ("", None) and not (key == "href" and str(value).startswith(("javascript:", "data:")))
+        }
+
+    # Layout wrappers (div, span, ...) only add nesting, keep their content
+    for tag in soup.find_all(True):
+        if tag.name not in SEMANTIC_TAGS:
+            tag.unwrap()
+
+# Function to collapse long runs of repeated rows and items into samples plus a count
+def collapse_repeats(soup, sample_rows):
+    for parent_name, child_name in REPEATED_CHILDREN.items():
+        for parent in soup.find_all(parent_name):
+            children = parent.find_all(child_name, recursive=False)
+            # Rows already summarized by an earlier, looser pass
+            dropped = 0
+            for child in children:
+                match = COLLAPSED_NOTE.match(child.get_text())
+                if match:
+                    dropped += int(match.group(1))
+                    child.decompose()
+            children = [child for child in children if not child.decomposed]
+            if len(children) <= sample_rows and not dropped:
+                continue
+            for child in children[sample_rows:]:
+                child.decompose()
+            dropped += max(0, len(children) - sample_rows)
+            note = soup.new_tag(child_name)
+            if child_name == "tr":
+                cell = soup.new_tag("td")
+                cell.string = f"... {dropped} more rows"
+                note.append(cell)
+            else:
+                note.string = f"... {dropped} more items"
+            parent.append(note)
+
+def render(soup):
+    html = WHITESPACE.sub(" ", str(soup))
+    return BETWEEN_TAGS.sub("><", html).strip()
+
+# Function to cut text to a token budget
+def truncate_tokens(text, max_tokens):
+    tokenizer = get_tokenizer()
+    tokens = tokenizer.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return tokenizer.decode(tokens[:max_tokens]) + " ... [truncated]"
+
+# Function to shrink page HTML to the parts the html agent needs, within a token budget
+def reduce_html(html, max_tokens=HTML_MAX_TOKENS, sample_rows=HTML_SAMPLE_ROWS):
+    """
+    Reduce raw page HTML to compact semantic markup
+
+    Scripts, styles, SVG, hidden elements, comments and non-semantic
+    attributes are removed and layout wrappers are unwrapped, keeping headings,
+    navigation, links, forms and table cells. Long tables, lists and selects
+    keep `sample_rows` samples plus a count of what was dropped. If the result
+    is still over `max_tokens`, the samples are cut further and finally the
+    markup is truncated.
+
+    Args:
+        html: Page HTML (plain text is passed through with whitespace collapsed)
+        max_tokens: Token budget for the result
+        sample_rows: Repeated rows or items kept per table, list or select
+
+    Returns:
+        (reduced_html, stats) where stats has tokens_before, tokens_after,
+        bytes_before and bytes_after
+    """
+    tokens_before = count_tokens(html)
+    soup = BeautifulSoup(html, "html.parser")
+    strip_markup(soup)
+
+    samples = sample_rows
+    collapse_repeats(soup, samples)
+    reduced = render(soup)
+    while count_tokens(reduced) > max_tokens and samples > 1:
+        samples = max(1, samples // 2)
+        collapse_repeats(soup, samples)
+        reduced = render(soup)
+    reduced = truncate_tokens(reduced, max_tokens)
+
+    stats = {
+        "tokens_before": tokens_before,
+        "tokens_after": count_tokens(reduced),
+        "bytes_before": len(html.encode("utf-8")),
+        "bytes_after": len(reduced.encode("utf-8"))
+    }
+    return reduced, stats
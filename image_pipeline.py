@@ -0,0 +1,123 @@
+import os
+import io
+import re
+import base64
+import hashlib
+import threading
+from dataclasses import dataclass
+from cachetools import LRUCache
+from PIL import Image
+
+# Longest side of the image sent to the vision model
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1568"))
+# Upper bound on the re-encoded image size
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", "400000"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+# Screenshots whose perceptual hashes differ in at most this many bits count as the same screen
+IMAGE_HASH_DISTANCE = int(os.getenv("IMAGE_HASH_DISTANCE", "4"))
+
+# Formats the vision model accepts as they are
+SENDABLE_FORMATS = {"PNG", "JPEG", "WEBP", "GIF"}
+
+DATA_URL = re.compile(r"^data:(image/[\w.+-]+)?(;base64)?,", re.IGNORECASE)
+
+@dataclass
+class PreparedImage:
+    data_url: str
+    phash: int
+    width: int
+    height: int
+    bytes_before: int
+    bytes_after: int
+
+# Function to turn a data URL (or bare base64) into raw image bytes
+def decode_data_url(data_url):
+    match = DATA_URL.match(data_url)
+    payload = data_url[match.end():] if match else data_url
+    return base64.b64decode(payload + "=" * (-len(payload) % 4))
+
+# Function to compute a 64-bit difference hash, stable across small rendering differences
+def dhash(image, hash_size=8):
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def hash_distance(a, b):
+    return bin(a ^ b).count("1")
+
+# Function to downscale and re-encode an image within the dimension and byte limits
+def encode_bounded(image, max_dimension=IMAGE_MAX_DIMENSION, max_bytes=IMAGE_MAX_BYTES):
+    image = image.convert("RGB")
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    quality = IMAGE_JPEG_QUALITY
+    while True:
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        data = buffer.getvalue()
+        if len(data) <= max_bytes or min(image.size) <= 64:
+            return data, image.size
+        if quality > 50:
+            quality -= 15
+        else:
+            # Quality alone is not enough, shrink the image as well
+            image = image.resize((max(1, int(image.width * 0.75)), max(1, int(image.height * 0.75))), Image.LANCZOS)
+
+class ImagePipeline:
+    """
+    Decodes, downscales and hashes screenshots
+
+    Prepared screenshots are cached by a digest of the uploaded data, so a
+    screenshot the frontend resends is decoded only once. The perceptual hash
+    identifies the screen for the analysis memo; screenshots within
+    `hash_distance` bits of each other count as the same screen.
+    """
+
+    def __init__(self, max_dimension=IMAGE_MAX_DIMENSION, max_bytes=IMAGE_MAX_BYTES, hash_distance=IMAGE_HASH_DISTANCE):
+        self.max_dimension = max_dimension
+        self.max_bytes = max_bytes
+        self.hash_distance = hash_distance
+        self.prepared = LRUCache(maxsize=64)
+        self._lock = threading.Lock()
+
+    def prepare(self, screenshot):
+        """
+        Returns:
+            A PreparedImage with a bounded JPEG data URL and the perceptual hash
+        """
+        digest = hashlib.sha256(screenshot.encode("utf-8")).hexdigest()
+        with self._lock:
+            cached = self.prepared.get(digest)
+        if cached is not None:
+            return cached
+
+        raw = decode_data_url(screenshot)
+        with Image.open(io.BytesIO(raw)) as image:
+            image.load()
+            phash = dhash(image)
+            if image.format in SENDABLE_FORMATS and max(image.size) <= self.max_dimension and len(raw) <= self.max_bytes:
+                # Already small enough, re-encoding would only cost quality
+                data, (width, height), mime = raw, image.size, Image.MIME[image.format]
+            else:
+                data, (width, height) = encode_bounded(image, self.max_dimension, self.max_bytes)
+                mime = "image/jpeg"
+        prepared = PreparedImage(
+            data_url=f"data:{mime};base64," + base64.b64encode(data).decode("ascii"),
+            phash=phash,
+            width=width,
+            height=height,
+            bytes_before=len(raw),
+            bytes_after=len(data)
+        )
+        with self._lock:
+            self.prepared[digest] = prepared
+        return prepared
+
+_image_pipeline = ImagePipeline()
+
+def get_image_pipeline():
+    return _image_pipeline
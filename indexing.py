@@ -0,0 +1,391 @@
+import hashlib
+import uuid
+from dataclasses import dataclass, field
+from qdrant_client import models
+from utils import SHARED_COLLECTION_NAME, COMPONENT_NAME_FIELD, VECTOR_QUANTIZATION, is_shared_layout
+
+# Namespace for deterministic Qdrant point IDs
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "applique.myntra.com/rag")
+
+SCROLL_BATCH_SIZE = 256
+
+# Collections already checked against the current vector settings by this process
+_verified_collections = set()
+
+# Function to hash a piece of text content
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# Function to derive a stable point ID from a chunk's identity
+def make_point_id(component_name, url, chunk_hash):
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{component_name}|{url}|{chunk_hash}"))
+
+@dataclass
+class SyncPlan:
+    """
+    Changes needed to bring one component collection in line with freshly scraped pages
+    """
+    collection_name: str
+    url: str = ""  # page the plan was made for, when planned page by page
+    upserts: list = field(default_factory=list)  # (point_id, Document) pairs to embed
+    deletes: list = field(default_factory=list)  # point IDs to remove
+    refreshes: list = field(default_factory=list)  # (point_id, metadata) of kept chunks on changed pages
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+
+    def summary(self):
+        return f"added={self.added} updated={self.updated} removed={self.removed} unchanged={self.unchanged}"
+
+# Function to load the IDs and metadata of every point already in a collection
+def get_existing_points(client, collection_name):
+    if not client.collection_exists(collection_name):
+        return {}
+
+    existing = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=SCROLL_BATCH_SIZE,
+            offset=offset,
+            with_payload=["metadata"],
+            with_vectors=False
+        )
+        for point in points:
+            existing[str(point.id)] = (point.payload or {}).get("metadata", {})
+        if offset is None:
+            return existing
+
+# Function to check whether a page has already been ingested into a collection
+def has_points_for_url(client, collection_name, url):
+    if not client.collection_exists(collection_name):
+        return False
+    result = client.count(
+        collection_name=collection_name,
+        count_filter=models.Filter(
+            must=[models.FieldCondition(key="metadata.url", match=models.MatchValue(value=url))]
+        ),
+        exact=False
+    )
+    return result.count > 0
+
+# Function to build the Qdrant quantization config for a VECTOR_QUANTIZATION setting
+def get_quantization_config(quantization=VECTOR_QUANTIZATION):
+    if quantization == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if quantization == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    if quantization in ("", "none"):
+        return None
+    raise ValueError(f"Unknown VECTOR_QUANTIZATION '{quantization}', expected none, scalar or binary")
+
+def quantization_kind(config):
+    if isinstance(config, models.ScalarQuantization):
+        return "scalar"
+    if isinstance(config, models.BinaryQuantization):
+        return "binary"
+    return "none"
+
+# Function to list the collections that hold the chunks of the active storage layout
+def get_layout_collection_names(client):
+    """
+    During a migration the shared collection and the per-component ones both
+    exist; only those of STORAGE_LAYOUT are returned, so nothing is read twice.
+    """
+    names = [
+        collection.name
+        for collection in client.get_collections().collections
+        if collection.name.startswith("applique_")
+    ]
+    if is_shared_layout():
+        return [name for name in names if name == SHARED_COLLECTION_NAME]
+    return [name for name in names if name != SHARED_COLLECTION_NAME]
+
+@dataclass
+class StoredChunk:
+    collection_name: str
+    page_content: str
+    metadata: dict
+    vector: list
+
+# Function to read every chunk of the active storage layout, with its vector, in one pass
+def scan_stored_chunks(client):
+    """
+    Scroll the collections of the active layout once; the router centroids,
+    the lexical index and the embedded index are all built from the result
+
+    Returns:
+        StoredChunks grouped by collection, each (url, chunk_hash) once
+    """
+    chunks = []
+    seen = set()
+    for collection_name in sorted(get_layout_collection_names(client)):
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=SCROLL_BATCH_SIZE,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            for point in points:
+                payload = point.payload or {}
+                metadata = payload.get("metadata", {})
+                key = (metadata.get("url"), metadata.get("chunk_hash") or str(point.id))
+                if key in seen or not isinstance(point.vector, list):
+                    continue
+                seen.add(key)
+                chunks.append(StoredChunk(collection_name, payload.get("page_content", ""), metadata, point.vector))
+            if offset is None:
+                break
+    print(f"Read {len(chunks)} stored chunks")
+    return chunks
+
+# Function to remove every stored page that is not in the given set of page URLs
+def delete_missing_pages(client, urls):
+    """
+    Used after a complete crawl: points of pages outside urls belong to pages
+    or components removed from the site. In the per-component layout, a
+    collection left without any page is dropped as a whole.
+
+    Returns:
+        The number of points removed
+    """
+    urls = set(urls)
+    removed = 0
+    for collection_name in get_layout_collection_names(client):
+        existing = get_existing_points(client, collection_name)
+        stale = [point_id for point_id, metadata in existing.items() if metadata.get("url") not in urls]
+        if not stale:
+            continue
+        if len(stale) == len(existing) and not is_shared_layout():
+            client.delete_collection(collection_name)
+            _verified_collections.difference_update({key for key in _verified_collections if key[0] == collection_name})
+            print(f"Dropped collection '{collection_name}' of a component no longer on the site")
+        else:
+            client.delete(
+                collection_name=collection_name,
+                points_selector=models.PointIdsList(points=stale)
+            )
+            print(f"Removed {len(stale)} points of pages no longer on the site from '{collection_name}'")
+        removed += len(stale)
+    return removed
+
+# Function to find the stored collections whose vectors have another length than the configured one
+def find_resized_collections(client, vector_size):
+    return [
+        name
+        for name in get_layout_collection_names(client)
+        if client.get_collection(name).config.params.vectors.size != vector_size
+    ]
+
+# Function to create a collection on first write, or bring it in line with the vector settings
+def ensure_collection(client, collection_name, vector_size, quantization=VECTOR_QUANTIZATION):
+    """
+    A collection whose vectors have another length (EMBEDDING_DIMENSIONS
+    changed) is recreated, since none of its points can be searched together
+    with the new ones; a different quantization is applied in place.
+    """
+    if (collection_name, vector_size, quantization) in _verified_collections:
+        return
+    quantization_config = get_quantization_config(quantization)
+    if client.collection_exists(collection_name):
+        config = client.get_collection(collection_name).config
+        if config.params.vectors.size == vector_size:
+            if quantization_kind(config.quantization_config) != quantization_kind(quantization_config):
+                client.update_collection(
+                    collection_name=collection_name,
+                    quantization_config=quantization_config or models.Disabled.DISABLED
+                )
+                print(f"Set quantization of collection '{collection_name}' to {quantization_kind(quantization_config)}")
+            _verified_collections.add((collection_name, vector_size, quantization))
+            return
+        print(
+            f"Collection '{collection_name}' stores {config.params.vectors.size}-dimension vectors, "
+            f"recreating it for {vector_size} dimensions"
+        )
+        client.delete_collection(collection_name)
+
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(size=vector_size, distance=models.Distance.COSINE),
+        quantization_config=quantization_config
+    )
+    if collection_name == SHARED_COLLECTION_NAME:
+        # Queries filter the shared collection by component, so index that field
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=COMPONENT_NAME_FIELD,
+            field_schema=models.PayloadSchemaType.KEYWORD
+        )
+    _verified_collections.add((collection_name, vector_size, quantization))
+    print(f"Created collection '{collection_name}'")
+
+# Function to work out which chunks of a component need embedding, and which points are stale
+def plan_component_sync(collection_name, existing, documents, splitter, index_version=""):
+    """
+    Diff freshly scraped page documents against the points stored in a collection
+
+    Pages whose content hash matches the stored one are skipped without splitting.
+    Changed pages are split and each chunk gets an ID derived from component, URL
+    and chunk hash, so only chunks whose text changed need to be embedded again.
+
+    Args:
+        collection_name: Qdrant collection holding the component
+        existing: Mapping of point ID to stored metadata (see get_existing_points)
+        documents: Scraped page Documents for the component
+        splitter: Text splitter used to chunk changed pages
+        index_version: Chunking/embedding settings folded into every hash, so changing
+            them re-chunks and re-embeds pages whose text did not change
+
+    Returns:
+        A SyncPlan with the points to upsert and delete and the change counts
+    """
+    plan = SyncPlan(collection_name=collection_name)
+
+    stored_page_hashes = {}
+    stored_slots = {}
+    for point_id, metadata in existing.items():
+        url = metadata.get("url")
+        if metadata.get("page_hash"):
+            stored_page_hashes.setdefault(url, set()).add(metadata["page_hash"])
+        if metadata.get("chunk_index") is not None:
+            stored_slots[(url, metadata["chunk_index"])] = point_id
+
+    keep = set()
+    new_chunks = []
+    for document in documents:
+        url = document.metadata["url"]
+        page_hash = content_hash(f"{index_version}\x00{document.page_content}")
+        if stored_page_hashes.get(url) == {page_hash}:
+            # Page unchanged since the last ingest, keep all of its points
+            kept = [pid for pid, metadata in existing.items() if metadata.get("url") == url]
+            keep.update(kept)
+            plan.unchanged += len(kept)
+            continue
+
+        document.metadata["page_hash"] = page_hash
+        seen = set()
+        for chunk in splitter.split_documents([document]):
+            chunk_hash = content_hash(f"{index_version}\x00{chunk.page_content}")
+            point_id = make_point_id(chunk.metadata["component_name"], url, chunk_hash)
+            if point_id in seen:
+                continue
+            seen.add(point_id)
+            chunk.metadata["chunk_index"] = len(seen) - 1
+            chunk.metadata["chunk_hash"] = chunk_hash
+            new_chunks.append((point_id, chunk))
+
+    keep.update(point_id for point_id, _ in new_chunks if point_id in existing)
+    for point_id, chunk in new_chunks:
+        if point_id in existing:
+            # Same text, but the page hash and position have to follow the new page
+            plan.refreshes.append((point_id, chunk.metadata))
+            plan.unchanged += 1
+            continue
+
+        plan.upserts.append((point_id, chunk))
+        replaced = stored_slots.get((chunk.metadata["url"], chunk.metadata["chunk_index"]))
+        if replaced and replaced not in keep:
+            plan.updated += 1
+        else:
+            plan.added += 1
+
+    plan.deletes = [point_id for point_id in existing if point_id not in keep]
+    plan.removed = max(0, len(plan.deletes) - plan.updated)
+    return plan
+
+# Function to write a sync plan to Qdrant given the embeddings of its upserts
+def apply_sync_plan(client, plan, vectors):
+    if plan.upserts:
+        ensure_collection(client, plan.collection_name, len(vectors[0]))
+        client.upsert(
+            collection_name=plan.collection_name,
+            points=[
+                models.PointStruct(
+                    id=point_id,
+                    vector=vector,
+                    payload={"page_content": chunk.page_content, "metadata": chunk.metadata}
+                )
+                for (point_id, chunk), vector in zip(plan.upserts, vectors)
+            ]
+        )
+
+    if plan.refreshes:
+        client.batch_update_points(
+            collection_name=plan.collection_name,
+            update_operations=[
+                models.SetPayloadOperation(
+                    set_payload=models.SetPayload(payload={"metadata": metadata}, points=[point_id])
+                )
+                for point_id, metadata in plan.refreshes
+            ]
+        )
+
+    # Delete stale points only after the replacements are stored
+    if plan.deletes:
+        client.delete(
+            collection_name=plan.collection_name,
+            points_selector=models.PointIdsList(points=plan.deletes)
+        )
+
+# Function to copy every per-component collection into the shared collection
+def migrate_to_shared_collection(client, drop_source=False):
+    """
+    Migrate the per-component layout to a single shared collection
+
+    Points keep their IDs, vectors and payloads; the component name is already
+    in each payload, which the shared collection indexes for filtering.
+
+    Args:
+        client: QdrantClient holding the collections
+        drop_source: Delete each per-component collection once it is copied
+
+    Returns:
+        The number of points copied
+    """
+    source_names = [
+        collection.name
+        for collection in client.get_collections().collections
+        if collection.name.startswith("applique_") and collection.name != SHARED_COLLECTION_NAME
+    ]
+    print(f"Migrating {len(source_names)} collections into '{SHARED_COLLECTION_NAME}'")
+
+    copied = 0
+    for source_name in source_names:
+        offset = None
+        count = 0
+        while True:
+            points, offset = client.scroll(
+                collection_name=source_name,
+                limit=SCROLL_BATCH_SIZE,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            if points:
+                ensure_collection(client, SHARED_COLLECTION_NAME, len(points[0].vector))
+                client.upsert(
+                    collection_name=SHARED_COLLECTION_NAME,
+                    points=[
+                        models.PointStruct(id=point.id, vector=point.vector, payload=point.payload)
+                        for point in points
+                    ]
+                )
+                count += len(points)
+            if offset is None:
+                break
+
+        copied += count
+        print(f"Copied {count} points from '{source_name}'")
+        if drop_source:
+            client.delete_collection(source_name)
+            print(f"Dropped '{source_name}'")
+
+    print(f"Migration complete: {copied} points in '{SHARED_COLLECTION_NAME}'. Set STORAGE_LAYOUT=shared to use it.")
+    return copied
@@ -1,155 +1,115 @@
 import os
 from dotenv import load_dotenv
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_qdrant import QdrantVectorStore
+from clients import get_qdrant_client
 from bs4 import BeautifulSoup
-import requests
 from urllib.parse import urljoin, urlparse
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-import time
 from datetime import datetime
 from langchain_core.documents import Document
+from browser_pool import BrowserPool, DEFAULT_SCRAPE_WORKERS
+from fetcher import fetch_page, render_page
+from crawler import Crawler
+from indexing import has_points_for_url, find_resized_collections, ensure_collection, scan_stored_chunks
+from pipeline import IngestPipeline, get_index_version
+from chunker import SectionChunker
+from snapshot import SnapshotWriter, read_snapshot
+from router import build_component_centroids
+from lexical_index import build_lexical_index
+from embedded_index import export_embedded_index, should_export_embedded_index
+from retrieval import is_embedded_backend
+from answer_cache import bump_ingest_generation
+from embedding_cache import get_embeddings
 from utils import extract_component_name, get_collection_name_for_component
 
 # Load environment variables
 load_dotenv()
 
-# Function to extract all links from a given URL using Selenium
-def extract_links(url, base_domain="applique.myntra.com", component_only=True):
+# Function to crawl the docs site, rendering pages only when their static HTML has no links
+def crawl_site(url, base_domain="applique.myntra.com", pool=None):
+    render = (lambda page_url: render_page(pool, page_url)) if pool else None
+    crawler = Crawler(base_domain, render=render)
+    return crawler.crawl([url])
+
+# Function to extract all links reachable from a given URL (crawler with Selenium fallback)
+def extract_links(url, base_domain="applique.myntra.com", component_only=True, pool=None):
     print(f"Fetching links from: {url}")
     print(f"Using base domain filter: {base_domain}")
     print(f"Component links only: {component_only}")
     
+    owns_pool = pool is None
+    if owns_pool:
+        pool = BrowserPool(size=1)
+
     try:
-        # Set up Chrome options
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")  # Run in headless mode
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        
-        # Initialize the driver
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-        
-        # Navigate to the URL
-        driver.get(url)
-        
-        # Wait for JavaScript to load
-        time.sleep(3)
-        
-        # Get the page source after JavaScript execution
-        page_source = driver.page_source
-        
-        # Parse with BeautifulSoup
-        soup = BeautifulSoup(page_source, "html.parser")
-        print(f"Page title: {soup.title.text if soup.title else 'No title'}")
-        
-        # Find all links
-        all_found_links = []
-        filtered_links = []
-        
-        for a_tag in soup.find_all('a', href=True):
-            href = a_tag['href']
-            # Convert relative URLs to absolute
-            full_url = urljoin(url, href)
-            all_found_links.append(full_url)
-            
-            # Only include links from the same domain
-            if base_domain in urlparse(full_url).netloc:
-                # Check if component only is enabled
-                if component_only:
-                    # Only keep URLs that contain '/components/' in their path
-                    if '/components/' in urlparse(full_url).path:
-                        filtered_links.append(full_url)
-                else:
-                    filtered_links.append(full_url)
-        
-        # Close the driver
-        driver.quit()
-        
-        print(f"Total links found: {len(all_found_links)}")
-        print(f"Sample of all links found (first 5): {all_found_links[:5]}")
-        
-        # Print unique links for debugging
-        unique_links = list(set(filtered_links))
-        print(f"Found {len(unique_links)} unique component links")
-        
-        return unique_links
+        result = crawl_site(url, base_domain, pool)
+        return filter_links(result.pages, component_only)
     except Exception as e:
         print(f"Error accessing URL: {str(e)}")
         return []
+    finally:
+        if owns_pool:
+            pool.close()
 
-# Function to scrape component data from a URL using Selenium
-def scrape_component_content(url):
-    print(f"Scraping detailed content from: {url}")
-    try:
-        # Set up Chrome options
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        
-        # Initialize the driver
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-        
-        # Navigate to the URL
-        driver.get(url)
-        
-        # Wait for JavaScript to load (increase time for more complex pages)
-        time.sleep(5)
-        
-        # Get the page source after JavaScript execution
-        page_source = driver.page_source
-        
-        # Parse with BeautifulSoup
-        soup = BeautifulSoup(page_source, "html.parser")
-        
-        # Extract component name
-        component_name = extract_component_name(url)
-        
-        # Extract main content
-        main_content = soup.find('main')
-        if not main_content:
-            main_content = soup.find('body')
-        
-        # Extract specific sections (adjust selectors based on actual page structure)
-        
-        # Getting all text content
-        full_text_content = main_content.get_text(separator=' ', strip=True) if main_content else ""
-        
-        # Try to extract code blocks
-        code_blocks = []
-        pre_tags = soup.find_all('pre')
-        for pre in pre_tags:
-            code_blocks.append(pre.get_text())
-        
-        # Try to extract API props (find tables or other structured content)
-        api_sections = []
-        tables = soup.find_all('table')
-        for table in tables:
-            api_sections.append(table.get_text(separator=' ', strip=True))
-            
-        # Get all images
-        image_urls = []
-        for img in soup.find_all('img'):
-            src = img.get('src')
-            if src:
-                full_img_url = urljoin(url, src)
-                image_urls.append(full_img_url)
-        
-        # Close the driver
-        driver.quit()
-        
-        # Combine all content with clear section markers
-        combined_content = f"""
+# Function to keep only the component documentation pages
+def filter_links(links, component_only=True):
+    if not component_only:
+        return list(links)
+    # Only keep URLs that contain '/components/' in their path
+    component_links = [link for link in links if '/components/' in urlparse(link).path]
+    print(f"Found {len(component_links)} unique component links")
+    return component_links
+
+# Function to turn a rendered component page into a langchain Document
+def parse_component_page(url, page_source):
+    # Parse with BeautifulSoup
+    soup = BeautifulSoup(page_source, "html.parser")
+    
+    # Extract component name
+    component_name = extract_component_name(url)
+    
+    # Extract main content
+    main_content = soup.find('main')
+    if not main_content:
+        main_content = soup.find('body')
+    
+    # Extract specific sections (adjust selectors based on actual page structure)
+    
+    # Try to extract code blocks
+    code_blocks = []
+    pre_tags = soup.find_all('pre')
+    for pre in pre_tags:
+        code_blocks.append(pre.get_text())
+    
+    # Try to extract API props (find tables or other structured content), one line per row
+    api_sections = []
+    tables = soup.find_all('table')
+    for table in tables:
+        rows = []
+        for row in table.find_all('tr'):
+            cells = [cell.get_text(separator=' ', strip=True) for cell in row.find_all(['th', 'td'])]
+            if any(cells):
+                rows.append(" | ".join(cells))
+        api_sections.append("\n".join(rows) if rows else table.get_text(separator=' ', strip=True))
+    
+    # Getting the descriptive text, without the code and tables already captured above
+    for tag in pre_tags + tables:
+        tag.extract()
+    full_text_content = main_content.get_text(separator=' ', strip=True) if main_content else ""
+    
+    # Get all images
+    image_urls = []
+    for img in soup.find_all('img'):
+        src = img.get('src')
+        if src:
+            full_img_url = urljoin(url, src)
+            image_urls.append(full_img_url)
+    
+    # Combine all content with clear section markers
+    combined_content = f"""
 Component: {component_name}
 URL: {url}
 
 DESCRIPTION:
-{full_text_content[:2000]}  # Limiting to prevent very large documents
+{full_text_content}
 
 CODE EXAMPLES:
 {' '.join(code_blocks)}
@@ -161,55 +121,64 @@ IMAGES:
 {', '.join(image_urls)}
 """
 
-        # Create and return langchain Document object with metadata
-        return Document(
-            page_content=combined_content,
-            metadata={
-                "component_name": component_name,
-                "url": url,
-                "has_code_examples": len(code_blocks) > 0,
-                "has_api_props": len(api_sections) > 0,
-                "has_images": len(image_urls) > 0,
-                "scraped_at": datetime.now().isoformat()
+    # Create and return langchain Document object with metadata
+    return Document(
+        page_content=combined_content,
+        metadata={
+            "component_name": component_name,
+            "url": url,
+            "has_code_examples": len(code_blocks) > 0,
+            "has_api_props": len(api_sections) > 0,
+            "has_images": len(image_urls) > 0,
+            "scraped_at": datetime.now().isoformat(),
+            # Structured sections for the section-aware chunker, not stored on chunks
+            "sections": {
+                "description": full_text_content,
+                "code_examples": code_blocks,
+                "api_props": api_sections
             }
-        )
-    except Exception as e:
-        print(f"Error scraping content from {url}: {str(e)}")
-        return None
+        }
+    )
+
+# Function to scrape component data from a URL (static fetch, Selenium fallback)
+def scrape_component_content(url, pool=None):
+    print(f"Scraping detailed content from: {url}")
+    owns_pool = pool is None
+    if owns_pool:
+        pool = BrowserPool(size=1)
 
-# Function to create a collection for a specific component
-def create_component_collection(component_name, documents, embeddings):
-    collection_name = get_collection_name_for_component(component_name)
-    print(f"Creating collection '{collection_name}' for component: {component_name}")
-    
     try:
-        # Create vector store
-        vector_store = QdrantVectorStore.from_documents(
-            documents=documents,
-            embedding=embeddings,
-            url="http://localhost:6333",  # Use local Qdrant server
-            collection_name=collection_name,
-            force_recreate=True  # Recreate the collection if it already exists
-        )
-        print(f"Successfully created collection '{collection_name}'")
-        return vector_store
+        # Only render with JavaScript when the static HTML is missing sections
+        page_source, method = fetch_page(url, pool)
+        print(f"Fetched {url} via {method}")
+        return parse_component_page(url, page_source)
     except Exception as e:
-        print(f"Error creating collection for {component_name}: {str(e)}")
+        print(f"Error scraping content from {url}: {str(e)}")
         return None
+    finally:
+        if owns_pool:
+            pool.close()
 
 # Main ingestion function
-def ingest_components(base_url="https://applique.myntra.com/components/accordion"):
+def ingest_components(base_url="https://applique.myntra.com/components/accordion", workers=DEFAULT_SCRAPE_WORKERS, snapshot_path=None):
     """
     Scrape and ingest component data from the design system into Qdrant
     
     Args:
         base_url: Starting URL for scraping component documentation
+        workers: Number of headless browsers scraping pages concurrently
+        snapshot_path: Optional path of a compressed corpus snapshot to save the scraped pages to
         
     Returns:
         A dictionary of component names and their corresponding vector stores
     """
-    # Get all component links
-    all_links = extract_links(base_url, component_only=True)
+    with BrowserPool(size=workers) as pool:
+        return _ingest_components(base_url, pool, snapshot_path)
+
+def _ingest_components(base_url, pool, snapshot_path):
+    # Discover all component links, conditionally re-fetching pages seen in earlier runs
+    crawl_result = crawl_site(base_url, pool=pool)
+    all_links = filter_links(crawl_result.pages, component_only=True)
     print(f"Found {len(all_links)} component links")
     
     # Extract component names
@@ -228,50 +197,150 @@ def ingest_components(base_url="https://applique.myntra.com/components/accordion
         print("Skipping vector store creation.")
         return []
     
-    # Create embeddings
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small",
-        api_key=os.getenv("OPEN_API_KEY")
-    )
+    # Create embeddings (cached on disk, shared with query processing)
+    embeddings = get_embeddings()
     
-    # Create documents for each component and store in separate collections
-    collections = {}
+    # Stream pages through scrape -> split -> embed -> upsert, re-embedding only changed chunks
+    print(f"Processing all components with {pool.size} browser workers and streaming into Qdrant...")
+    client = get_qdrant_client()
     
-    # Process all components
-    print("Processing all components and storing directly in Qdrant...")
+    splitter = SectionChunker()
+    index_version = get_index_version(splitter, embeddings)
+    crawl_state = crawl_result.state
+    ingest_links = [link for link in all_links if extract_component_name(link)]
     
-    for link in all_links:
-        component_name = extract_component_name(link)
-        if component_name:
-            # Scrape the component documentation
-            document = scrape_component_content(link)
-            if document:
-                # Group documents by component
-                if component_name not in collections:
-                    collections[component_name] = []
-                collections[component_name].append(document)
-                print(f"Added document for {component_name}")
+    # Pages that are not ingested have nothing to wait for before their validators are kept
+    for link in set(crawl_result.pages) - set(ingest_links):
+        crawl_state.commit(link)
+    
+    # Pages that answered 304 keep their stored chunks, provided they were ingested before
+    # with the current chunker and embedding settings
+    unchanged_links = [
+        link for link in ingest_links
+        if link in crawl_result.unchanged
+        and crawl_state.get(link).get("index_version") == index_version
+        and has_points_for_url(client, get_collection_name_for_component(extract_component_name(link)), link)
+    ]
+    resized = rebuild_resized_collections(client, embeddings)
+    if resized and unchanged_links:
+        # The recreated collections are empty, so every page has to be indexed again
+        print(f"Scraping {len(unchanged_links)} unchanged pages as well to refill the recreated collections")
+        unchanged_links = []
+    if snapshot_path and unchanged_links:
+        # A snapshot has to hold the whole corpus, so scrape unchanged pages too
+        print(f"Scraping {len(unchanged_links)} unchanged pages as well to complete the snapshot")
+        unchanged_links = []
+    print(f"Skipping {len(unchanged_links)} unchanged component pages")
     
-    # Create collections in Qdrant for each component
-    vector_stores = {}
-    print(f"Creating vector stores for {len(collections)} components")
+    indexed_links = set()
     
-    for component_name, docs in collections.items():
-        # Split documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
+    def on_indexed(link):
+        indexed_links.add(link)
+        # Only now may the next run trust a 304 for the page
+        crawl_state.commit(link, index_version=index_version)
+    
+    snapshot = SnapshotWriter(snapshot_path, source=base_url) if snapshot_path else None
+    try:
+        pipeline = IngestPipeline(
+            scrape=lambda link: scrape_component_content(link, pool),
+            client=client,
+            embeddings=embeddings,
+            splitter=splitter,
+            scrape_workers=pool.size,
+            snapshot=snapshot,
+            on_indexed=on_indexed
         )
-        split_docs = text_splitter.split_documents(docs)
-        print(f"Creating {len(split_docs)} chunks for component '{component_name}'")
-        
-        # Create collection
-        vector_store = create_component_collection(component_name, split_docs, embeddings)
-        if vector_store:
-            vector_stores[component_name] = vector_store
+        # Components removed from the site are only dropped when the crawl reached every page
+        totals = pipeline.run(ingest_links, skip_urls=unchanged_links, complete=crawl_result.complete)
+    finally:
+        if resized:
+            # Pages that failed during the rebuild have no points left; fetch them in full next run
+            lost_links = set(ingest_links) - indexed_links
+            for link in lost_links:
+                crawl_state.forget(link)
+            if lost_links:
+                print(f"{len(lost_links)} pages could not be indexed again after the rebuild and are missing until the next ingest")
+        crawl_state.save()
+        if snapshot:
+            snapshot.close()
     
-    print(f"Successfully created {len(vector_stores)} component collections in Qdrant")
+    finish_ingest(client, totals, embeddings)
     return component_names
 
+# Function to rebuild the Qdrant collections from a corpus snapshot, without a browser
+def ingest_from_snapshot(snapshot_path):
+    """
+    Replay a corpus snapshot through the split, embed and upsert stages
+    
+    Args:
+        snapshot_path: Snapshot written by a previous ingest
+        
+    Returns:
+        The component names found in the snapshot
+        
+    Raises:
+        OSError, ValueError: If the snapshot cannot be opened or has a bad header
+        RuntimeError: If the snapshot could not be read to the end
+    """
+    if not os.getenv("OPEN_API_KEY"):
+        print("OPEN_API_KEY not found in environment variables.")
+        print("Skipping vector store creation.")
+        return []
+    
+    # Fail before anything is written when the snapshot is missing or unreadable
+    documents = read_snapshot(snapshot_path)
+    embeddings = get_embeddings()
+    client = get_qdrant_client()
+    rebuild_resized_collections(client, embeddings)
+    pipeline = IngestPipeline(
+        scrape=None,
+        client=client,
+        embeddings=embeddings,
+        splitter=SectionChunker()
+    )
+    # Raises on a truncated or corrupt snapshot, before the derived indexes are rebuilt
+    totals = pipeline.replay(documents)
+    finish_ingest(client, totals, embeddings)
+    return pipeline.component_names
+
+# Function to recreate, before anything is indexed, the collections stored with another vector length
+def rebuild_resized_collections(client, embeddings):
+    """
+    Changing EMBEDDING_DIMENSIONS makes every stored vector unusable, so the
+    affected collections are emptied up front and the ingest becomes a full
+    rebuild, instead of a collection being dropped by whichever upsert reaches
+    it first
+    
+    Returns:
+        The names of the recreated collections
+    """
+    vector_size = embeddings.vector_size()
+    resized = find_resized_collections(client, vector_size)
+    if resized:
+        print(f"Vector length changed to {vector_size}, rebuilding {len(resized)} collections from scratch")
+    for collection_name in resized:
+        ensure_collection(client, collection_name, vector_size)
+    return resized
+
+def report_ingest(totals, embeddings):
+    print(
+        f"Ingest complete: {totals['added']} chunks added, {totals['updated']} updated, "
+        f"{totals['removed']} removed, {totals['unchanged']} unchanged"
+    )
+    print(f"Embedding cache: {embeddings.stats()}")
+
+# Function to refresh everything derived from the stored chunks after an ingest
+def finish_ingest(client, totals, embeddings):
+    report_ingest(totals, embeddings)
+    # One scroll over the stored chunks feeds every derived index
+    chunks = scan_stored_chunks(client)
+    build_component_centroids(chunks)
+    build_lexical_index(chunks)
+    if should_export_embedded_index(is_embedded_backend()):
+        export_embedded_index(chunks)
+    if totals["added"] or totals["updated"] or totals["removed"]:
+        # Cached answers may quote chunks that just changed
+        bump_ingest_generation()
+
 if __name__ == "__main__":
     ingest_components() 
\ No newline at end of file
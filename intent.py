@@ -0,0 +1,126 @@
+import re
+import time
+from dataclasses import dataclass, field
+
+GREETING = "greeting"
+FOLLOW_UP = "follow_up"
+HTML_ONLY = "html_only"
+VISUAL_ONLY = "visual_only"
+FULL_ANALYSIS = "full_analysis"
+
+# Keyword -> {signal: weight}; phrases are matched on word boundaries, longest first
+KEYWORD_SIGNALS = {
+    # Greetings and small talk
+    "hi": {"greeting": 2}, "hello": {"greeting": 2}, "hey": {"greeting": 2},
+    "good morning": {"greeting": 2}, "good afternoon": {"greeting": 2}, "good evening": {"greeting": 2},
+    "how are you": {"greeting": 2}, "what can you do": {"greeting": 2}, "help": {"greeting": 1},
+    "thank you": {"greeting": 2}, "thanks": {"greeting": 2}, "bye": {"greeting": 2}, "goodbye": {"greeting": 2},
+    # Questions about what was already discussed
+    "what about": {"follow_up": 2}, "tell me more": {"follow_up": 2}, "more about": {"follow_up": 1},
+    "you said": {"follow_up": 2}, "you mentioned": {"follow_up": 2}, "earlier": {"follow_up": 1},
+    "elaborate": {"follow_up": 2}, "why": {"follow_up": 1}, "that": {"follow_up": 1}, "it": {"follow_up": 1},
+    "also": {"follow_up": 1}, "again": {"follow_up": 1}, "previous": {"follow_up": 1},
+    # Page structure and text, answered from the HTML
+    "tab": {"html": 2}, "tabs": {"html": 2}, "button": {"html": 2}, "buttons": {"html": 2}, "link": {"html": 2},
+    "links": {"html": 2}, "menu": {"html": 2}, "navigation": {"html": 2}, "form": {"html": 2}, "field": {"html": 2},
+    "fields": {"html": 2}, "table": {"html": 2}, "column": {"html": 2}, "columns": {"html": 2}, "row": {"html": 1},
+    "rows": {"html": 1}, "dropdown": {"html": 2}, "filter": {"html": 2}, "filters": {"html": 2},
+    "option": {"html": 1}, "options": {"html": 1}, "setting": {"html": 1}, "settings": {"html": 1},
+    "section": {"html": 1}, "where is": {"html": 2}, "where do i": {"html": 2}, "how do i": {"html": 1},
+    "what does": {"html": 1}, "orders": {"html": 1}, "catalog": {"html": 1}, "inventory": {"html": 1},
+    "returns": {"html": 1}, "price": {"html": 1}, "prices": {"html": 1}, "listing": {"html": 1}, "text": {"html": 1},
+    # Visual content, answered from the screenshot
+    "chart": {"visual": 2}, "charts": {"visual": 2}, "graph": {"visual": 2}, "graphs": {"visual": 2},
+    "image": {"visual": 2}, "images": {"visual": 2}, "screenshot": {"visual": 2}, "picture": {"visual": 2},
+    "photo": {"visual": 2}, "visual": {"visual": 2}, "map": {"visual": 2}, "plot": {"visual": 2},
+    "trend": {"visual": 2}, "trends": {"visual": 2}, "color": {"visual": 2}, "colour": {"visual": 2},
+    "banner": {"visual": 2}, "logo": {"visual": 2}, "look like": {"visual": 2}, "looks": {"visual": 1},
+    "layout": {"visual": 1}, "design": {"visual": 1}, "see": {"visual": 1}, "dashboard": {"visual": 1, "html": 1},
+    # Requests for a full read of the page
+    "analyze": {"analysis": 2}, "analyse": {"analysis": 2}, "explain": {"analysis": 1}, "describe": {"analysis": 1},
+    "summary": {"analysis": 2}, "summarize": {"analysis": 2}, "overview": {"analysis": 2}, "insights": {"analysis": 2},
+    "review": {"analysis": 2}, "this page": {"analysis": 2}, "this screen": {"analysis": 2}, "improve": {"analysis": 1},
+    "optimize": {"analysis": 1}, "performance": {"analysis": 1, "visual": 1}, "sales": {"analysis": 1},
+    "business": {"analysis": 1}, "everything": {"analysis": 2}, "examine": {"analysis": 2}, "tell me about": {"analysis": 1},
+    "details": {"analysis": 1}, "information": {"analysis": 1}, "show me": {"analysis": 1}, "check": {"analysis": 1},
+    "look at": {"analysis": 1},
+}
+
+# Messages up to this many words can be pure greetings
+GREETING_MAX_WORDS = 8
+
+class KeywordAutomaton:
+    """
+    Finds every known keyword in one pass over the text
+
+    The keywords are compiled once into a single alternation, longest first,
+    so multi-word phrases win over the words they contain.
+    """
+
+    def __init__(self, keywords):
+        phrases = sorted(keywords, key=len, reverse=True)
+        self.pattern = re.compile(r"\b(?:" + "|".join(re.escape(phrase) for phrase in phrases) + r")\b")
+
+    def scan(self, text):
+        return self.pattern.findall(text.lower())
+
+@dataclass
+class IntentDecision:
+    intent: str
+    scores: dict = field(default_factory=dict)
+    matched: list = field(default_factory=list)
+    elapsed_us: float = 0.0
+
+    @property
+    def run_html(self):
+        return self.intent in (HTML_ONLY, FULL_ANALYSIS)
+
+    @property
+    def run_image(self):
+        return self.intent in (VISUAL_ONLY, FULL_ANALYSIS)
+
+_automaton = KeywordAutomaton(KEYWORD_SIGNALS)
+
+# Function to decide which agents a chat message needs
+def classify_intent(chat_input, has_context=False):
+    """
+    Classify a chat message as greeting, follow-up, HTML-only, visual-only or full analysis
+
+    Keyword matches add weighted scores per signal and a few rules pick the
+    intent: short messages with only small talk are greetings; with earlier
+    turns, a message with follow-up cues and no page or visual cues is a
+    follow-up; broad analysis requests and mixed page/visual cues get both
+    specialists, page-only or visual-only cues pick one, and messages without
+    any cues get both.
+
+    Args:
+        chat_input: The user's message
+        has_context: Whether the conversation has earlier turns
+
+    Returns:
+        An IntentDecision with the intent, signal scores and matched keywords
+    """
+    started = time.perf_counter()
+    text = (chat_input or "").strip()
+    matched = _automaton.scan(text)
+    scores = {"greeting": 0, "follow_up": 0, "html": 0, "visual": 0, "analysis": 0}
+    for keyword in matched:
+        for signal, weight in KEYWORD_SIGNALS[keyword].items():
+            scores[signal] += weight
+
+    content_score = scores["html"] + scores["visual"] + scores["analysis"]
+    if scores["greeting"] and not content_score and len(text.split()) <= GREETING_MAX_WORDS:
+        intent = GREETING
+    elif has_context and scores["follow_up"] and not content_score:
+        intent = FOLLOW_UP
+    elif (scores["analysis"] >= 2 and scores["analysis"] >= max(scores["html"], scores["visual"])) or (scores["html"] and scores["visual"]):
+        intent = FULL_ANALYSIS
+    elif scores["html"] > scores["visual"]:
+        intent = HTML_ONLY
+    elif scores["visual"] > scores["html"]:
+        intent = VISUAL_ONLY
+    else:
+        # No usable cues: analyze everything the frontend sent
+        intent = FULL_ANALYSIS
+
+    return IntentDecision(intent, scores, matched, (time.perf_counter() - started) * 1e6)
@@ -0,0 +1,219 @@
+import os
+import re
+import gzip
+import json
+import math
+import threading
+from collections import Counter
+from langchain_core.documents import Document
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "lexical_index.json.gz")
+# BM25 parameters
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Component-name tokens count this many times, so chunks of the named component rank first
+COMPONENT_NAME_BOOST = 3
+# Constant of reciprocal-rank fusion; larger values flatten the rank differences
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+WORD = re.compile(r"[A-Za-z0-9]+(?:[-_][A-Za-z0-9]+)*")
+CAMEL_CASE = re.compile(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in", "is",
+    "it", "me", "my", "of", "on", "or", "show", "take", "takes", "tell", "that", "the", "this", "to", "use",
+    "what", "which", "with", "you"
+}
+# Words that mark a query as a lookup of a component's API
+LOOKUP_CUES = {
+    "prop", "props", "property", "properties", "api", "attribute", "attributes", "param", "params",
+    "parameter", "parameters", "argument", "arguments", "default", "defaults", "signature", "import"
+}
+
+# Function to split text into search terms, keeping identifiers whole as well as in parts
+def tokenize(text, drop_stopwords=False):
+    """
+    "virtual-grid" gives virtual-grid, virtualgrid, virtual and grid;
+    "onRowClick" gives onrowclick, on, row and click.
+    """
+    tokens = []
+    for word in WORD.findall(text):
+        lower = word.lower()
+        if drop_stopwords and lower in STOPWORDS:
+            continue
+        tokens.append(lower)
+        parts = [part.lower() for piece in re.split(r"[-_]", word) for part in CAMEL_CASE.findall(piece)]
+        if len(parts) > 1:
+            joined = "".join(parts)
+            if joined != lower:
+                tokens.append(joined)
+            tokens.extend(parts)
+    return tokens
+
+# Function to normalize a name or query so "virtual grid", "virtual-grid" and "virtual_grid" compare equal
+def normalize_name(text):
+    return " ".join(re.split(r"[\s_-]+", text.lower().strip()))
+
+class LexicalIndex:
+    """
+    In-process BM25 index over the stored chunks
+
+    Each chunk is indexed by its text plus its component name (boosted), so
+    prop names from the API tables and component names can be found without
+    an embedding.
+
+    Args:
+        documents: Chunk Documents with "component_name" and "collection" in their metadata
+    """
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.postings = {}
+        self.lengths = []
+        for i, document in enumerate(documents):
+            component_name = document.metadata.get("component_name") or ""
+            terms = Counter(tokenize(document.page_content))
+            for term in tokenize(component_name):
+                terms[term] += COMPONENT_NAME_BOOST
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, []).append((i, frequency))
+            self.lengths.append(sum(terms.values()))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def search(self, query, k=2, component_names=None):
+        """
+        Rank chunks by BM25 score against the query
+
+        Args:
+            query: The user query
+            k: Number of results
+            component_names: Only return chunks of these components, when given
+
+        Returns:
+            Up to k Documents with "score" (BM25) and "retrieval" in their metadata
+        """
+        allowed = set(component_names) if component_names else None
+        scores = {}
+        total = len(self.documents)
+        for term in set(tokenize(query, drop_stopwords=True)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, frequency in postings:
+                if allowed is not None and self.documents[i].metadata.get("component_name") not in allowed:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / self.average_length)
+                scores[i] = scores.get(i, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            Document(
+                page_content=self.documents[i].page_content,
+                metadata={**self.documents[i].metadata, "score": score, "retrieval": "lexical"}
+            )
+            for i, score in ranked
+        ]
+
+    def save(self, path=LEXICAL_INDEX_PATH):
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in self.documents], f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=LEXICAL_INDEX_PATH):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return cls([Document(page_content=record["page_content"], metadata=record["metadata"]) for record in json.load(f)])
+
+# Function to build the lexical index from every chunk stored in Qdrant
+def build_lexical_index(chunks, path=LEXICAL_INDEX_PATH):
+    """
+    Save a BM25 index of the stored chunks
+
+    Args:
+        chunks: StoredChunks from indexing.scan_stored_chunks
+
+    Returns:
+        The number of indexed chunks
+    """
+    documents = [
+        Document(page_content=chunk.page_content, metadata={**chunk.metadata, "collection": chunk.collection_name})
+        for chunk in chunks
+        if chunk.page_content
+    ]
+    LexicalIndex(documents).save(path)
+    print(f"Saved lexical index of {len(documents)} chunks to {path}")
+    return len(documents)
+
+# Function to find the known component names a query mentions verbatim
+def find_component_names(query, component_names):
+    normalized_query = f" {normalize_name(' '.join(WORD.findall(query)))} "
+    mentioned = {name: f" {normalize_name(name)} " for name in component_names if name}
+    mentioned = {name: padded for name, padded in mentioned.items() if padded in normalized_query}
+    # "virtual grid" names virtual-grid, not grid as well
+    return [
+        name for name, padded in mentioned.items()
+        if not any(padded != other and padded in other for other in mentioned.values())
+    ]
+
+# Function to tell whether a query is an exact lookup the lexical index can answer alone
+def is_exact_lookup(query, component_names):
+    """
+    Returns:
+        The component names the query looks up, or an empty list when the
+        query should go through dense retrieval
+    """
+    mentioned = find_component_names(query, component_names)
+    if mentioned and LOOKUP_CUES & set(tokenize(query)):
+        return mentioned
+    return []
+
+# Function to merge ranked result lists by reciprocal-rank fusion
+def reciprocal_rank_fusion(result_lists, k=2, rrf_k=RRF_K):
+    """
+    Args:
+        result_lists: Lists of Documents, each sorted best first
+        k: Number of fused results
+
+    Returns:
+        Up to k Documents with the fused score in "score"
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, 1):
+            key = (doc.metadata.get("url"), doc.metadata.get("chunk_hash") or doc.page_content)
+            score, best = fused.get(key, (0.0, doc))
+            fused[key] = (score + 1.0 / (rrf_k + rank), best)
+    ranked = sorted(fused.values(), key=lambda item: item[0], reverse=True)[:k]
+    return [
+        Document(page_content=doc.page_content, metadata={**doc.metadata, "score": score, "retrieval": "fused"})
+        for score, doc in ranked
+    ]
+
+class LexicalIndexLoader:
+    """
+    Loads the saved index lazily and reloads it when an ingest rewrites the file
+    """
+
+    def __init__(self, path=LEXICAL_INDEX_PATH):
+        self.path = path
+        self.index = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                return None
+            if mtime != self._mtime:
+                self.index = LexicalIndex.load(self.path)
+                self._mtime = mtime
+                print(f"Loaded lexical index of {len(self.index.documents)} chunks")
+            return self.index
+
+_loader = LexicalIndexLoader()
+
+def get_lexical_index():
+    return _loader.get()
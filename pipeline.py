@@ -0,0 +1,361 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from embedding_batcher import EMBED_CONCURRENCY, pack_batches
+from indexing import get_existing_points, plan_component_sync, apply_sync_plan, delete_missing_pages
+from qdrant_client import models
+from utils import count_tokens, get_collection_name_for_component
+
+# Maximum items waiting between two pipeline stages
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
+
+# Marks the end of a stage's output
+_DONE = object()
+
+# Function to identify the chunker and embedding settings stored chunks were made with
+def get_index_version(splitter, embeddings):
+    # Changing the chunker, embedding model or vector length invalidates every stored chunk
+    embeddings_fingerprint = getattr(embeddings, "fingerprint", getattr(embeddings, "model_name", ""))
+    return f"{getattr(splitter, 'fingerprint', type(splitter).__name__)}|{embeddings_fingerprint}"
+
+class StageStats:
+    """
+    Throughput counters for one pipeline stage
+    """
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.units = 0
+        self.errors = 0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, items=1, units=0):
+        with self._lock:
+            if self.started is None:
+                self.started = time.monotonic()
+            self.items += items
+            self.units += units
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def summary(self):
+        if self.started is None:
+            return f"{self.name}: idle, {self.errors} errors"
+        elapsed = (self.finished or time.monotonic()) - self.started
+        rate = self.units / elapsed if elapsed > 0 else 0.0
+        return f"{self.name}: {self.items} items, {self.units} {self.unit} in {elapsed:.2f}s ({rate:.1f} {self.unit}/s), {self.errors} errors"
+
+class IngestPipeline:
+    """
+    Streaming scrape -> split -> embed -> upsert pipeline
+
+    Each stage runs in its own thread(s) and hands work to the next one through
+    a bounded queue, so a slow stage blocks the ones before it instead of letting
+    scraped pages pile up in memory.
+
+    Args:
+        scrape: Callable turning a URL into a page Document (or None on failure);
+            unused when replaying a snapshot
+        client: QdrantClient the collections are synced into
+        embeddings: langchain Embeddings used for changed chunks
+        splitter: Text splitter used to chunk changed pages
+        scrape_workers: Number of pages scraped concurrently
+        queue_size: Capacity of each queue between stages
+        snapshot: Optional SnapshotWriter receiving every scraped page
+        on_indexed: Optional callable(url) called once a page's changes are in Qdrant
+    """
+
+    def __init__(self, scrape, client, embeddings, splitter, scrape_workers=1, queue_size=PIPELINE_QUEUE_SIZE, snapshot=None, on_indexed=None):
+        self.scrape = scrape
+        self.snapshot = snapshot
+        self.on_indexed = on_indexed
+        self.client = client
+        self.embeddings = embeddings
+        self.splitter = splitter
+        self.scrape_workers = max(1, scrape_workers)
+        self.pages = queue.Queue(maxsize=queue_size)
+        self.plans = queue.Queue(maxsize=queue_size)
+        self.embedded = queue.Queue(maxsize=queue_size)
+        self.stats = {
+            "scrape": StageStats("scrape", "pages"),
+            "split": StageStats("split", "chunks"),
+            "embed": StageStats("embed", "tokens"),
+            "upsert": StageStats("upsert", "points")
+        }
+        self.totals = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        self.index_version = get_index_version(splitter, embeddings)
+        # Points already stored per collection, and the URLs seen this run
+        self._existing = {}
+        self._seen_urls = {}
+        self._seen_components = set()
+        self._kept_urls = set()
+        # Error that stopped the source stage early, which leaves the corpus incomplete
+        self.source_error = None
+
+    # Scrape stage: several workers pull URLs and push page Documents
+    def _scrape_stage(self, urls):
+        url_queue = queue.Queue()
+        for url in urls:
+            url_queue.put(url)
+
+        def worker():
+            while True:
+                try:
+                    url = url_queue.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    document = self.scrape(url)
+                except Exception as e:
+                    print(f"Error scraping {url}: {str(e)}")
+                    document = None
+                if document is None:
+                    # Keep the stored points of pages that failed to scrape this time
+                    self._kept_urls.add(url)
+                    self.stats["scrape"].error()
+                    continue
+                self.stats["scrape"].record(units=1)
+                if self.snapshot:
+                    self.snapshot.write(document)
+                self.pages.put(document)
+
+        workers = [threading.Thread(target=worker, daemon=True) for _ in range(self.scrape_workers)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.stats["scrape"].finish()
+        self.pages.put(_DONE)
+
+    # Replay stage: stream pages from a snapshot instead of scraping them
+    def _replay_stage(self, documents):
+        try:
+            for document in documents:
+                self.stats["scrape"].record(units=1)
+                self.pages.put(document)
+        except Exception as e:
+            self.source_error = e
+            self.stats["scrape"].error()
+            print(f"Error reading snapshot: {str(e)}")
+        finally:
+            self.stats["scrape"].finish()
+            self.pages.put(_DONE)
+
+    # Split stage: diff each page against its collection and chunk it if it changed
+    def _split_stage(self):
+        while True:
+            document = self.pages.get()
+            if document is _DONE:
+                break
+            try:
+                component_name = document.metadata["component_name"]
+                url = document.metadata["url"]
+                collection_name = get_collection_name_for_component(component_name)
+                if collection_name not in self._existing:
+                    self._existing[collection_name] = get_existing_points(self.client, collection_name)
+                    self._seen_urls[collection_name] = set()
+                self._seen_urls[collection_name].add(url)
+                self._seen_components.add(component_name)
+
+                existing = {
+                    point_id: metadata
+                    for point_id, metadata in self._existing[collection_name].items()
+                    if metadata.get("url") == url
+                }
+                plan = plan_component_sync(collection_name, existing, [document], self.splitter, self.index_version)
+                plan.url = url
+                self.stats["split"].record(units=len(plan.upserts))
+                self.plans.put(plan)
+            except Exception as e:
+                self.stats["split"].error()
+                print(f"Error splitting {document.metadata.get('url')}: {str(e)}")
+        self.stats["split"].finish()
+        self.plans.put(_DONE)
+
+    # Embed stage: pack chunks from any component into token-budgeted batches
+    def _embed_stage(self):
+        lock = threading.Lock()
+        in_flight = threading.BoundedSemaphore(EMBED_CONCURRENCY)
+        vectors = {}
+        remaining = {}
+        # Plans with a failed batch, kept referenced so their ids are not reused
+        failed = {}
+        # Chunks not yet dispatched, as (plan, index, text, tokens)
+        pending = []
+
+        def embed_batch(items, tokens):
+            try:
+                batch_vectors = self.embeddings.embed_documents([text for _, _, text, _ in items])
+                self.stats["embed"].record(items=len(items), units=tokens)
+                ready = []
+                with lock:
+                    for (plan, index, _, _), vector in zip(items, batch_vectors):
+                        if id(plan) in failed:
+                            continue
+                        vectors[id(plan)][index] = vector
+                        remaining[id(plan)] -= 1
+                        if remaining[id(plan)] == 0:
+                            ready.append((plan, vectors.pop(id(plan))))
+                            del remaining[id(plan)]
+                for item in ready:
+                    self.embedded.put(item)
+            except Exception as e:
+                newly_failed = []
+                with lock:
+                    for plan, _, _, _ in items:
+                        if id(plan) not in failed:
+                            failed[id(plan)] = plan
+                            vectors.pop(id(plan), None)
+                            remaining.pop(id(plan), None)
+                            newly_failed.append(plan)
+                for plan in newly_failed:
+                    # Never upserted, so the page keeps its stored points and is retried next run
+                    if plan.url:
+                        self._kept_urls.add(plan.url)
+                    self.stats["embed"].error()
+                print(f"Error embedding batch of {len(items)} chunks, skipping {len(newly_failed)} pages: {str(e)}")
+            finally:
+                in_flight.release()
+
+        with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as executor:
+            def dispatch(flush):
+                # Send every full batch; the last, partial one waits for more chunks unless flushing
+                batches = pack_batches([text for _, _, text, _ in pending], token_counts=[tokens for *_, tokens in pending])
+                if not flush:
+                    batches = batches[:-1]
+                sent = 0
+                for indexes, tokens in batches:
+                    # Blocks while EMBED_CONCURRENCY batches are already in flight
+                    in_flight.acquire()
+                    executor.submit(embed_batch, [pending[i] for i in indexes], tokens)
+                    sent += len(indexes)
+                del pending[:sent]
+
+            while True:
+                plan = self.plans.get()
+                if plan is _DONE:
+                    break
+                if not plan.upserts:
+                    self.embedded.put((plan, []))
+                    continue
+
+                with lock:
+                    vectors[id(plan)] = [None] * len(plan.upserts)
+                    remaining[id(plan)] = len(plan.upserts)
+                for index, (_, chunk) in enumerate(plan.upserts):
+                    pending.append((plan, index, chunk.page_content, count_tokens(chunk.page_content)))
+
+                # Nothing else is queued, send a partial batch rather than letting the upsert stage idle
+                dispatch(flush=self.plans.empty())
+
+            dispatch(flush=True)
+
+        self.stats["embed"].finish()
+        self.embedded.put(_DONE)
+
+    # Upsert stage: write each fully embedded plan to Qdrant
+    def _upsert_stage(self):
+        while True:
+            item = self.embedded.get()
+            if item is _DONE:
+                break
+            plan, plan_vectors = item
+            try:
+                apply_sync_plan(self.client, plan, plan_vectors)
+                self.stats["upsert"].record(units=len(plan.upserts))
+                for key in self.totals:
+                    self.totals[key] += getattr(plan, key)
+                if self.on_indexed and plan.url:
+                    self.on_indexed(plan.url)
+            except Exception as e:
+                self.stats["upsert"].error()
+                print(f"Error upserting into '{plan.collection_name}': {str(e)}")
+        self.stats["upsert"].finish()
+
+    # Remove points of pages that are no longer part of their component
+    def _delete_stale_pages(self):
+        for collection_name, existing in self._existing.items():
+            seen = self._seen_urls[collection_name] | self._kept_urls
+            # Only components scraped this run can have stale pages, others are left alone
+            stale = [
+                point_id
+                for point_id, metadata in existing.items()
+                if metadata.get("url") not in seen and metadata.get("component_name") in self._seen_components
+            ]
+            if stale:
+                self.client.delete(
+                    collection_name=collection_name,
+                    points_selector=models.PointIdsList(points=stale)
+                )
+                self.totals["removed"] += len(stale)
+                print(f"Removed {len(stale)} points of pages no longer in '{collection_name}'")
+
+    def run(self, urls, skip_urls=(), complete=False):
+        """
+        Stream every URL through all stages and wait for the last upsert
+
+        Args:
+            urls: Page URLs to ingest
+            skip_urls: Pages known to be unchanged; they are not scraped and keep their points
+            complete: urls is every page on the site, so stored pages and components
+                outside it are removed as well
+
+        Returns:
+            A dictionary of added/updated/removed/unchanged chunk counts
+        """
+        self._kept_urls.update(skip_urls)
+        skip = set(skip_urls)
+        totals = self._run_stages(self._scrape_stage, [url for url in urls if url not in skip])
+        if complete and urls:
+            self.totals["removed"] += delete_missing_pages(self.client, urls)
+        return totals
+
+    def replay(self, documents):
+        """
+        Stream already scraped page Documents (e.g. from a snapshot) through split, embed and upsert
+
+        Returns:
+            A dictionary of added/updated/removed/unchanged chunk counts
+
+        Raises:
+            RuntimeError: If the documents could not all be read; pages already
+                read are indexed, but no stale pages are removed
+        """
+        totals = self._run_stages(self._replay_stage, documents)
+        if self.source_error is not None:
+            raise RuntimeError(f"Snapshot replay stopped early: {str(self.source_error)}") from self.source_error
+        return totals
+
+    @property
+    def component_names(self):
+        return sorted(self._seen_components)
+
+    def _run_stages(self, source_stage, source):
+        stages = [
+            threading.Thread(target=source_stage, args=(source,), name="source"),
+            threading.Thread(target=self._split_stage, name="split"),
+            threading.Thread(target=self._embed_stage, name="embed"),
+            threading.Thread(target=self._upsert_stage, name="upsert")
+        ]
+        for thread in stages:
+            thread.start()
+        for thread in stages:
+            thread.join()
+
+        # Pages missing from an incomplete source are not stale
+        if self.source_error is None:
+            self._delete_stale_pages()
+        for stats in self.stats.values():
+            print(stats.summary())
+        return self.totals
@@ -1,19 +1,25 @@
 import os
+import asyncio
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings
-from openai import OpenAI
-from qdrant_client import QdrantClient
-from langchain_core.documents import Document
-from utils import get_collection_name_for_component
+from clients import get_openai_client, get_async_openai_client, get_qdrant_client
+from utils import FALLBACK_COLLECTION_NAME
+from embedding_cache import get_embeddings
+from router import route_query_locally
+from retrieval import retrieve
+from answer_cache import get_answer_cache
+from lexical_index import get_lexical_index, is_exact_lookup, reciprocal_rank_fusion
 
 # Load environment variables
 load_dotenv()
 
+# Dense and lexical candidates fused into the final results
+FUSION_CANDIDATES = int(os.getenv("FUSION_CANDIDATES", "8"))
+
 # Function to determine which collection to query based on user input
 def route_query_to_collections(query, component_names):
     if not os.getenv("OPEN_API_KEY"):
         print("OPEN_API_KEY not found. Cannot route query.")
-        return ["applique_components"]  # Fallback to a default collection
+        return [FALLBACK_COLLECTION_NAME]  # Fallback to a default collection
     
     # Create a system prompt for the LLM to determine relevant components
     system_prompt = f"""
@@ -32,10 +38,8 @@ def route_query_to_collections(query, component_names):
     """
     
     try:
-        # Initialize OpenAI client
-        client = OpenAI(
-            api_key=os.getenv("OPEN_API_KEY"),
-        )
+        # Shared, keep-alive OpenAI client
+        client = get_openai_client()
         
         response = client.chat.completions.create(
             model="gpt-3.5-turbo",
@@ -58,109 +62,228 @@ def route_query_to_collections(query, component_names):
     except Exception as e:
         print(f"Error routing query: {str(e)}")
         # Fallback to a default collection or try to guess based on keywords
-        return ["applique_components"]
+        return [FALLBACK_COLLECTION_NAME]
 
-# Function to search a specific collection using a direct Qdrant client
-def search_collection(collection_name, query, embeddings, k=2):
-    try:
-        # Create a direct connection to Qdrant
-        client = QdrantClient(url="http://localhost:6333")
-        
-        # Check if collection exists
-        if not client.collection_exists(collection_name):
-            print(f"Collection '{collection_name}' does not exist")
-            return []
-        
-        # Generate embedding for the query
-        query_embedding = embeddings.embed_query(query)
-        
-        # Perform the search
-        search_result = client.search(
-            collection_name=collection_name,
-            query_vector=query_embedding,
-            limit=k
-        )
-        
-        # Convert search results to documents
-        results = []
-        for scored_point in search_result:
-            payload = scored_point.payload
-            doc = Document(
-                page_content=payload.get("page_content", ""),
-                metadata=payload.get("metadata", {})
-            )
-            results.append(doc)
-        
-        print(f"Found {len(results)} results in collection '{collection_name}'")
-        return results
-    except Exception as e:
-        print(f"Error searching collection '{collection_name}': {str(e)}")
-        return []
-
-# Process a query and return RAG response
-def process_query(query, component_names):
-    # Check if we have API keys
-    if not os.getenv("OPEN_API_KEY"):
-        return "OPEN_API_KEY not found in environment variables. Cannot process query."
+# Function to build the chat messages for a RAG answer from the retrieved chunks
+def build_rag_messages(query, top_results):
+    context = "\n\n".join([doc.page_content for doc in top_results])
     
-    # Create embeddings
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small",
-        api_key=os.getenv("OPEN_API_KEY")
-    )
+    # Updated system prompt to include example code
+    system_prompt = """
+        You are a helpful assistant that provides information about Myntra's Appliqué Design System components.
+        Use the provided context to answer questions accurately and include the following in your response:
+
+        1. Brief explanation of the component and its purpose
+        2. Key features and variations
+        3. ALWAYS include practical code examples showing how to use the component (if available in the context)
+        4. Any important props or API details
+
+        Your response should be clear, concise, and focus on practical usage with code examples highlighted in markdown format.
+        """
     
-    # Initialize OpenAI client
-    client = OpenAI(
-        api_key=os.getenv("OPEN_API_KEY"),
-    )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Context information about Appliqué components:\n\n{context}\n\nQuestion: {query}"}
+    ]
+
+# Function to describe the retrieved chunks for clients, without their content
+def describe_sources(top_results):
+    return [
+        {
+            "component_name": doc.metadata.get("component_name"),
+            "url": doc.metadata.get("url"),
+            "section": doc.metadata.get("section"),
+            "score": doc.metadata.get("score"),
+            "retrieval": doc.metadata.get("retrieval", "dense")
+        }
+        for doc in top_results
+    ]
+
+NO_RESULTS_MESSAGE = "No relevant information found for your query. Please try a different question about the Appliqué Design System components."
+
+# Function to do everything that comes before generating an answer
+def prepare_query(query, component_names, use_cache=True):
+    """
+    Look the query up in the answer cache, then route and retrieve; exact
+    component lookups are served by the lexical index alone and everything
+    else fuses dense and lexical results
     
-    # Route query to appropriate collections
-    collection_names = route_query_to_collections(query, component_names)
+    Returns:
+        A dictionary with "answer" (set when no generation is needed), "cached"
+        ("exact", "semantic" or False), "query_vector" (None for lexical
+        lookups), "collection_names" and "top_results"
+    """
+    prepared = {"answer": None, "cached": False, "query_vector": None, "collection_names": [], "top_results": []}
     
-    # Perform search across all identified collections
-    all_results = []
-    for collection_name in collection_names:
-        results = search_collection(collection_name, query, embeddings, k=2)
-        all_results.extend(results)
+    # Answer repeated questions from the cache, before embedding anything
+    answer_cache = get_answer_cache()
+    if use_cache:
+        cached = answer_cache.get_exact(query)
+        if cached is not None:
+            print(f"Answered from cache (exact match): {answer_cache.stats()}")
+            return {**prepared, "answer": cached, "cached": "exact"}
     
-    # Sort results by relevance (if multiple collections were searched)
-    # This would require a reranking step which is a bit complex for this example
-    top_results = all_results[:2]  # Just take the top 2 for simplicity
+    # Exact lookups such as "what props does virtual-grid take" are answered
+    # from the lexical index alone, without embedding or routing the query
+    lexical_index = get_lexical_index()
+    lookup_components = is_exact_lookup(query, component_names) if lexical_index else []
+    top_results = lexical_index.search(query, k=2, component_names=lookup_components) if lookup_components else []
+    if top_results:
+        print(f"Lexical lookup of {lookup_components}, skipping the query embedding")
+        collection_names = sorted({doc.metadata["collection"] for doc in top_results})
+    else:
+        # Create embeddings (cached on disk, shared with ingestion)
+        embeddings = get_embeddings()
+        query_vector = embeddings.embed_query(query)
+        prepared["query_vector"] = query_vector
+        
+        # Reuse the answer of a near-identical earlier question
+        if use_cache:
+            cached = answer_cache.get_similar(query_vector)
+            if cached is not None:
+                print(f"Answered from cache (semantic match): {answer_cache.stats()}")
+                return {**prepared, "answer": cached, "cached": "semantic"}
+        
+        # Route query to appropriate collections, locally via component centroids when confident
+        collection_names = route_query_locally(
+            query,
+            query_vector,
+            llm_fallback=lambda q: route_query_to_collections(q, component_names)
+        )
+        
+        # Search all identified collections with the one query embedding, best scores first
+        top_results = retrieve(
+            get_qdrant_client(),
+            query_vector,
+            collection_names,
+            component_names,
+            k=FUSION_CANDIDATES if lexical_index else 2
+        )
+        if lexical_index:
+            # Fuse with the lexical ranking, which catches exact prop and component names
+            top_results = reciprocal_rank_fusion([top_results, lexical_index.search(query, k=FUSION_CANDIDATES)], k=2)
     
     print("\nQuery:", query)
     print("\nTop results:")
     for i, doc in enumerate(top_results):
         print(f"\n{i+1}. Component: {doc.metadata.get('component_name', 'Unknown')}")
         print(f"   URL: {doc.metadata.get('url', 'Unknown')}")
+        print(f"   Score: {doc.metadata.get('score', 0):.4f} ({doc.metadata.get('retrieval', 'dense')})")
         print(f"   Content preview: {doc.page_content[:150]}...")
     
+    prepared.update(collection_names=collection_names, top_results=top_results)
     # If no results found
     if not top_results:
-        return "No relevant information found for your query. Please try a different question about the Appliqué Design System components."
+        prepared["answer"] = NO_RESULTS_MESSAGE
+    return prepared
+
+def metadata_event(prepared):
+    return "metadata", {
+        "cached": prepared["cached"],
+        "collections": prepared["collection_names"],
+        "sources": describe_sources(prepared["top_results"])
+    }
+
+# Process a query and stream the RAG response as it is generated
+def process_query_stream(query, component_names, use_cache=True):
+    """
+    Answer a query as a stream of events
     
-    # RAG with OpenAI
-    context = "\n\n".join([doc.page_content for doc in top_results])
+    Retrieval metadata is sent as soon as the search finishes, before the
+    model starts generating, and the answer follows token by token.
     
-    # Updated system prompt to include example code
-    system_prompt = """
-        You are a helpful assistant that provides information about Myntra's Appliqué Design System components.
-        Use the provided context to answer questions accurately and include the following in your response:
-
-        1. Brief explanation of the component and its purpose
-        2. Key features and variations
-        3. ALWAYS include practical code examples showing how to use the component (if available in the context)
-        4. Any important props or API details
+    Yields:
+        (event, data) tuples:
+        - ("metadata", {"cached": ..., "collections": [...], "sources": [...]})
+        - ("token", text) for every piece of the answer
+        - ("done", {"cached": ...})
+        - ("error", {"error": message}) instead of the above when the query cannot be processed
+    """
+    # Check if we have API keys
+    if not os.getenv("OPEN_API_KEY"):
+        yield "error", {"error": "OPEN_API_KEY not found in environment variables. Cannot process query."}
+        return
+    
+    prepared = prepare_query(query, component_names, use_cache)
+    yield metadata_event(prepared)
+    if prepared["answer"] is not None:
+        yield "token", prepared["answer"]
+        yield "done", {"cached": prepared["cached"]}
+        return
+    
+    # RAG with OpenAI, forwarding tokens as they arrive
+    stream = get_openai_client().chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=build_rag_messages(query, prepared["top_results"]),
+        stream=True
+    )
+    
+    parts = []
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            yield "token", chunk.choices[0].delta.content
+    
+    # Only complete answers are cached; a consumer that stops early never gets here
+    if use_cache:
+        get_answer_cache().put(query, prepared["query_vector"], "".join(parts))
+    yield "done", {"cached": False}
 
-        Your response should be clear, concise, and focus on practical usage with code examples highlighted in markdown format.
-        """
+# Async variant of process_query_stream for the API server's event loop
+async def aprocess_query_stream(query, component_names, use_cache=True):
+    """
+    Same events as process_query_stream. Cache lookups, routing and retrieval
+    run in a worker thread; the answer is generated with the shared async client.
+    """
+    if not os.getenv("OPEN_API_KEY"):
+        yield "error", {"error": "OPEN_API_KEY not found in environment variables. Cannot process query."}
+        return
+    
+    prepared = await asyncio.to_thread(prepare_query, query, component_names, use_cache)
+    yield metadata_event(prepared)
+    if prepared["answer"] is not None:
+        yield "token", prepared["answer"]
+        yield "done", {"cached": prepared["cached"]}
+        return
     
-    response = client.chat.completions.create(
+    stream = await get_async_openai_client().chat.completions.create(
         model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Context information about Appliqué components:\n\n{context}\n\nQuestion: {query}"}
-        ]
+        messages=build_rag_messages(query, prepared["top_results"]),
+        stream=True
     )
     
-    result = response.choices[0].message.content
-    return result 
\ No newline at end of file
+    parts = []
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            yield "token", chunk.choices[0].delta.content
+    
+    if use_cache:
+        get_answer_cache().put(query, prepared["query_vector"], "".join(parts))
+    yield "done", {"cached": False}
+
+# Function to collect a stream of query events into the final answer
+def collect_answer(events):
+    parts = []
+    for event, data in events:
+        if event == "error":
+            return data["error"]
+        if event == "token":
+            parts.append(data)
+    return "".join(parts)
+
+async def acollect_answer(events):
+    parts = []
+    async for event, data in events:
+        if event == "error":
+            return data["error"]
+        if event == "token":
+            parts.append(data)
+    return "".join(parts)
+
+# Process a query and return RAG response
+def process_query(query, component_names, use_cache=True):
+    return collect_answer(process_query_stream(query, component_names, use_cache))
+
+async def aprocess_query(query, component_names, use_cache=True):
+    return await acollect_answer(aprocess_query_stream(query, component_names, use_cache))
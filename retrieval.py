@@ -0,0 +1,142 @@
+import os
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+from qdrant_client import models
+from qdrant_client.http.exceptions import UnexpectedResponse
+from utils import (
+    SHARED_COLLECTION_NAME,
+    COMPONENT_NAME_FIELD,
+    VECTOR_QUANTIZATION,
+    QUANTIZATION_OVERSAMPLING,
+    get_per_component_collection_name,
+    is_shared_layout
+)
+from embedded_index import get_embedded_index
+
+# "qdrant" searches the Qdrant server, "embedded" the in-process snapshot exported at ingest
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "qdrant")
+# Maximum collections searched at the same time
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "8"))
+
+# Long-lived pool shared by every query
+_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+# Function to turn a Qdrant hit into a Document that keeps its score
+def to_document(scored_point, collection_name):
+    payload = scored_point.payload or {}
+    return Document(
+        page_content=payload.get("page_content", ""),
+        metadata={
+            **payload.get("metadata", {}),
+            "score": scored_point.score,
+            "collection": collection_name
+        }
+    )
+
+# Function to build the search params: with quantized vectors, oversample and rescore at full precision
+def get_search_params(quantization=VECTOR_QUANTIZATION, oversampling=QUANTIZATION_OVERSAMPLING):
+    if quantization in ("", "none"):
+        return None
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(rescore=True, oversampling=oversampling)
+    )
+
+def is_embedded_backend():
+    return RETRIEVAL_BACKEND == "embedded"
+
+# Function to check that a collection can be searched on the configured backend
+def collection_exists(client, collection_name):
+    if is_embedded_backend():
+        index = get_embedded_index()
+        return index is not None and index.has_collection(collection_name)
+    return client.collection_exists(collection_name)
+
+# Function to search one collection of the in-process snapshot
+def search_embedded(collection_name, query_vector, k=2, component_filter=None):
+    index = get_embedded_index()
+    if index is None:
+        print("Embedded index not found, run an ingest to export it")
+        return []
+    try:
+        results = index.search(collection_name, query_vector, k, component_filter)
+    except Exception as e:
+        print(f"Error searching collection '{collection_name}': {str(e)}")
+        return []
+    if results is None:
+        print(f"Collection '{collection_name}' does not exist")
+        return []
+    print(f"Found {len(results)} results in collection '{collection_name}'")
+    return results
+
+# Function to search one collection with an already computed query vector
+def search_collection_by_vector(client, collection_name, query_vector, k=2, component_filter=None):
+    """
+    Args:
+        client: QdrantClient to search with (unused by the embedded backend)
+        component_filter: Only return chunks of these components, when given
+    """
+    if is_embedded_backend():
+        return search_embedded(collection_name, query_vector, k, component_filter)
+
+    query_filter = None
+    if component_filter:
+        query_filter = models.Filter(
+            must=[models.FieldCondition(key=COMPONENT_NAME_FIELD, match=models.MatchAny(any=list(component_filter)))]
+        )
+    try:
+        search_result = client.search(
+            collection_name=collection_name,
+            query_vector=query_vector,
+            query_filter=query_filter,
+            search_params=get_search_params(),
+            limit=k
+        )
+    except UnexpectedResponse as e:
+        if e.status_code == 404:
+            print(f"Collection '{collection_name}' does not exist")
+        else:
+            print(f"Error searching collection '{collection_name}': {str(e)}")
+        return []
+    except Exception as e:
+        print(f"Error searching collection '{collection_name}': {str(e)}")
+        return []
+
+    results = [to_document(scored_point, collection_name) for scored_point in search_result]
+    print(f"Found {len(results)} results in collection '{collection_name}'")
+    return results
+
+# Function to retrieve the best chunks across the routed collections
+def retrieve(client, query_vector, collection_names, component_names, k=2):
+    """
+    Search every routed collection with one query vector and merge hits by score
+
+    In the per-component layout the collections are searched concurrently, so
+    latency is that of the slowest search. In the shared layout the routed
+    components become a single filtered search. Either runs on Qdrant or, with
+    RETRIEVAL_BACKEND=embedded, on the in-process snapshot.
+
+    Args:
+        client: QdrantClient to search with (unused by the embedded backend)
+        query_vector: Embedding of the query, computed once by the caller
+        collection_names: Routed collections (per-component naming scheme)
+        component_names: Known component names, used to build the shared-layout filter
+        k: Number of results to return overall
+
+    Returns:
+        Up to k Documents sorted by descending score, with "score" and
+        "collection" in their metadata
+    """
+    if is_shared_layout():
+        # Map routed collection names back to component names for the payload filter
+        components_by_collection = {get_per_component_collection_name(name): name for name in component_names}
+        component_filter = [components_by_collection[name] for name in collection_names if name in components_by_collection]
+        return search_collection_by_vector(client, SHARED_COLLECTION_NAME, query_vector, k, component_filter)
+
+    unique_names = list(dict.fromkeys(collection_names))
+    futures = [
+        _executor.submit(search_collection_by_vector, client, collection_name, query_vector, k)
+        for collection_name in unique_names
+    ]
+    all_results = [doc for future in futures for doc in future.result()]
+    return heapq.nlargest(k, all_results, key=lambda doc: doc.metadata["score"])
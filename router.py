@@ -0,0 +1,163 @@
+import os
+import re
+import threading
+import time
+import numpy as np
+from cachetools import LRUCache
+from utils import FALLBACK_COLLECTION_NAME, get_per_component_collection_name
+
+CENTROIDS_PATH = os.getenv("CENTROIDS_PATH", "component_centroids.npz")
+# Maximum number of components a query is routed to
+ROUTER_TOP_K = int(os.getenv("ROUTER_TOP_K", "2"))
+# Cosine similarity the best component needs for the local route to be trusted
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", "0.35"))
+# Extra components are only kept if they score within this margin of the best one
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", "0.05"))
+ROUTER_CACHE_SIZE = int(os.getenv("ROUTER_CACHE_SIZE", "4096"))
+
+# Function to build a normalized centroid vector per component from its stored chunk vectors
+def build_component_centroids(chunks, path=CENTROIDS_PATH):
+    """
+    Average the stored chunk vectors of every component and save them for the router
+
+    Works with both storage layouts: chunks are grouped by the component name
+    in their metadata.
+
+    Args:
+        chunks: StoredChunks from indexing.scan_stored_chunks
+
+    Returns:
+        The number of components with a centroid
+    """
+    sums = {}
+    counts = {}
+    for chunk in chunks:
+        component_name = chunk.metadata.get("component_name")
+        if not component_name:
+            continue
+        vector = np.asarray(chunk.vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            continue
+        sums[component_name] = sums.get(component_name, 0) + vector / norm
+        counts[component_name] = counts.get(component_name, 0) + 1
+
+    if not sums:
+        print("No stored vectors found, component centroids not built")
+        return 0
+
+    names = sorted(sums)
+    matrix = np.stack([sums[name] / counts[name] for name in names]).astype(np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    np.savez(path, names=np.array(names), matrix=matrix)
+    print(f"Saved centroids for {len(names)} components to {path}")
+    return len(names)
+
+# Function to normalize a query so trivially different phrasings share a cache entry
+def normalize_query(query):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s-]", " ", query.lower())).strip()
+
+class CentroidRouter:
+    """
+    Routes queries to components by cosine similarity against component centroids
+
+    The centroid file is reloaded when a new ingest rewrites it, which also
+    clears the cache of routing decisions.
+    """
+
+    def __init__(self, path=CENTROIDS_PATH, top_k=ROUTER_TOP_K, min_score=ROUTER_MIN_SCORE, margin=ROUTER_MARGIN):
+        self.path = path
+        self.top_k = top_k
+        self.min_score = min_score
+        self.margin = margin
+        self.names = None
+        self.matrix = None
+        self.decisions = LRUCache(maxsize=ROUTER_CACHE_SIZE)
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime != self._mtime:
+            with np.load(self.path) as data:
+                self.names = [str(name) for name in data["names"]]
+                self.matrix = data["matrix"]
+            self._mtime = mtime
+            self.decisions.clear()
+            print(f"Loaded centroids for {len(self.names)} components")
+        return True
+
+    def cached(self, query):
+        with self._lock:
+            self._load()
+            return self.decisions.get(normalize_query(query))
+
+    def remember(self, query, collection_names):
+        with self._lock:
+            self.decisions[normalize_query(query)] = collection_names
+
+    def route(self, query_vector):
+        """
+        Pick the closest components for a query embedding
+
+        Returns:
+            A list of (component_name, score) pairs, or None when the best match
+            is below the confidence threshold, no centroids exist or they
+            were built with another vector length
+        """
+        with self._lock:
+            if not self._load():
+                return None
+            names, matrix = self.names, self.matrix
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        if matrix.shape[1] != query.shape[0]:
+            # Centroids of an earlier vector length, wait for the next ingest to rebuild them
+            return None
+        query /= max(np.linalg.norm(query), 1e-12)
+        scores = matrix @ query
+
+        k = min(self.top_k, len(names))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        best = scores[top[0]]
+        if best < self.min_score:
+            return None
+        return [(names[i], float(scores[i])) for i in top if scores[i] >= best - self.margin]
+
+_router = CentroidRouter()
+
+# Function to route a query locally, falling back to the LLM router for low-confidence queries
+def route_query_locally(query, query_vector, llm_fallback):
+    """
+    Route a query to collections using cached decisions, then centroids, then the LLM
+
+    Args:
+        query: The user query string
+        query_vector: Embedding of the query
+        llm_fallback: Callable(query) -> collection names, used for low-confidence queries
+
+    Returns:
+        A list of collection names in the per-component naming scheme
+    """
+    started = time.perf_counter()
+    cached = _router.cached(query)
+    if cached is not None:
+        print(f"Query routed from cache to {cached} in {(time.perf_counter() - started) * 1e6:.0f}us")
+        return cached
+
+    matches = _router.route(query_vector)
+    if matches is None:
+        print("Low-confidence local route, falling back to the LLM router")
+        collection_names = llm_fallback(query)
+    else:
+        collection_names = [get_per_component_collection_name(name) for name, _ in matches]
+        print(f"Query routed locally to {matches} in {(time.perf_counter() - started) * 1e6:.0f}us")
+
+    # Do not pin a failed LLM routing call in the cache
+    if collection_names != [FALLBACK_COLLECTION_NAME]:
+        _router.remember(query, collection_names)
+    return collection_names
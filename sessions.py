@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import asyncio
+import weakref
+import time
+import hashlib
+import threading
+from dataclasses import dataclass, field, asdict
+from cachetools import TTLCache
+from clients import get_async_openai_client
+from utils import count_tokens, get_tokenizer
+
+# Idle seconds after which a session is forgotten
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+# Token budget for the verbatim recent turns; older turns are folded into the summary
+SESSION_CONTEXT_TOKENS = int(os.getenv("SESSION_CONTEXT_TOKENS", "1200"))
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "300"))
+# Turns that always stay verbatim, however long they are
+SESSION_MIN_RECENT_TURNS = int(os.getenv("SESSION_MIN_RECENT_TURNS", "2"))
+# Chat prompts use the last 5 context items: the summary plus at most this many turns
+SESSION_MAX_RECENT_TURNS = int(os.getenv("SESSION_MAX_RECENT_TURNS", "4"))
+SESSION_SUMMARY_MODEL = os.getenv("SESSION_SUMMARY_MODEL", "gpt-4o-mini")
+# Directory for the on-disk backend; sessions live in memory only when unset
+SESSION_STORE_DIR = os.getenv("SESSION_STORE_DIR", "")
+
+WHITESPACE = re.compile(r"\s+")
+
+# Function to fingerprint page HTML, ignoring whitespace-only differences
+def fingerprint_html(html):
+    return hashlib.sha256(WHITESPACE.sub(" ", html or "").strip().encode("utf-8")).hexdigest() if html else ""
+
+def fingerprint_screenshot(screenshot):
+    return hashlib.sha256(screenshot.encode("utf-8")).hexdigest() if screenshot else ""
+
+@dataclass
+class ChatSession:
+    session_id: str
+    summary: str = ""
+    # Recent turns, formatted like the client-side context items
+    turns: list = field(default_factory=list)
+    html: str = ""
+    screenshot: str = ""
+    html_fingerprint: str = ""
+    screenshot_fingerprint: str = ""
+    updated_at: float = field(default_factory=time.time)
+
+    def context_items(self):
+        items = [f"Summary of earlier conversation: {self.summary}"] if self.summary else []
+        return items + self.turns
+
+    def update_page(self, html, screenshot):
+        """
+        Store the page sent with this turn; an omitted HTML or screenshot keeps the previous one
+
+        Returns:
+            (html, screenshot, changed) where changed lists what differs from the previous turn
+        """
+        changed = []
+        if html:
+            html_fingerprint = fingerprint_html(html)
+            if html_fingerprint != self.html_fingerprint:
+                self.html, self.html_fingerprint = html, html_fingerprint
+                changed.append("html")
+        if screenshot:
+            screenshot_fingerprint = fingerprint_screenshot(screenshot)
+            if screenshot_fingerprint != self.screenshot_fingerprint:
+                self.screenshot, self.screenshot_fingerprint = screenshot, screenshot_fingerprint
+                changed.append("screenshot")
+        return self.html, self.screenshot, changed
+
+class SessionStore:
+    """
+    Chat sessions keyed by session ID, evicted after `ttl` idle seconds
+
+    Sessions are kept in memory; with a `directory` they are also written to
+    one JSON file each, so they survive restarts and can be shared between
+    API processes. A cached session is reloaded when its file was written
+    since, e.g. by another process.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, maxsize=SESSION_MAX_SESSIONS, directory=SESSION_STORE_DIR):
+        self.ttl = ttl
+        self.directory = directory
+        self.sessions = TTLCache(maxsize=maxsize, ttl=ttl)
+        # File modification time each cached session was read or written at
+        self._mtimes = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._update_locks = weakref.WeakValueDictionary()
+        self._saves = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id):
+        # Hash the ID so client-supplied values can never escape the directory
+        return os.path.join(self.directory, hashlib.sha256(session_id.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, session_id):
+        with self._lock:
+            session = self.sessions.get(session_id)
+            cached_mtime = self._mtimes.get(session_id)
+        if not self.directory:
+            return session
+
+        path = self._path(session_id)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if session is not None and cached_mtime is not None and mtime <= cached_mtime:
+                return session
+            with open(path, "r", encoding="utf-8") as f:
+                session = ChatSession(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return session
+        if time.time() - session.updated_at > self.ttl:
+            self.delete(session_id)
+            return None
+        with self._lock:
+            self.sessions[session_id] = session
+            self._mtimes[session_id] = mtime
+        return session
+
+    def get_or_create(self, session_id):
+        return self.get(session_id) or ChatSession(session_id=session_id)
+
+    def save(self, session):
+        session.updated_at = time.time()
+        with self._lock:
+            self.sessions[session.session_id] = session
+            self._saves += 1
+            purge = self.directory and self._saves % 100 == 0
+        if self.directory:
+            path = self._path(session.session_id)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(asdict(session), f, ensure_ascii=False)
+            os.replace(f"{path}.tmp", path)
+            with self._lock:
+                self._mtimes[session.session_id] = os.stat(path).st_mtime_ns
+            if purge:
+                self.purge_expired()
+
+    # Function to get the lock that serializes updates of one session within this process
+    def update_lock(self, session_id):
+        with self._lock:
+            lock = self._update_locks.get(session_id)
+            if lock is None:
+                lock = asyncio.Lock()
+                self._update_locks[session_id] = lock
+            return lock
+
+    def delete(self, session_id):
+        with self._lock:
+            self.sessions.pop(session_id, None)
+            self._mtimes.pop(session_id, None)
+        if self.directory:
+            try:
+                os.remove(self._path(session_id))
+            except OSError:
+                pass
+
+    # Function to remove session files that have been idle longer than the TTL
+    def purge_expired(self):
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".json") and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+# Function to merge older turns into the running summary with a small model
+async def summarize_turns(summary, turns):
+    prompt = (
+        "Update the running summary of a conversation between a seller and an assistant about their partner-portal page. "
+        f"Keep facts, questions asked and advice given; stay under {SESSION_SUMMARY_TOKENS} tokens.\n\n"
+        f"Current summary:\n{summary or '(empty)'}\n\nNew turns:\n" + "\n".join(turns)
+    )
+    try:
+        response = await get_async_openai_client(verify=False).chat.completions.create(
+            model=SESSION_SUMMARY_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=SESSION_SUMMARY_TOKENS,
+            temperature=0
+        )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"Error summarizing session turns, keeping their tail instead: {str(e)}")
+        tokenizer = get_tokenizer()
+        tokens = tokenizer.encode("\n".join([summary] + turns).strip(), disallowed_special=())
+        return tokenizer.decode(tokens[-SESSION_SUMMARY_TOKENS:])
+
+# Function to keep the verbatim turns of a session under the token budget
+async def fold_old_turns(session, max_tokens=SESSION_CONTEXT_TOKENS):
+    """
+    Move the oldest turns into the summary until the rest fits the budget
+
+    Only the turns that no longer fit are summarized, together with the
+    previous summary, so each turn is summarized once.
+    """
+    folded = []
+    while len(session.turns) > SESSION_MIN_RECENT_TURNS and (
+        len(session.turns) > SESSION_MAX_RECENT_TURNS or count_tokens("\n".join(session.turns)) > max_tokens
+    ):
+        folded.append(session.turns.pop(0))
+    if folded:
+        print(f"Folding {len(folded)} older turns of session {session.session_id} into its summary")
+        session.summary = await summarize_turns(session.summary, folded)
+
+_session_store = SessionStore()
+
+def get_session_store():
+    return _session_store
@@ -0,0 +1,87 @@
+import os
+import gzip
+import json
+import threading
+from datetime import datetime
+from langchain_core.documents import Document
+
+# Bump when the layout of snapshot records changes
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FORMAT = "applique-corpus"
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+
+# Function to build a timestamped snapshot path
+def default_snapshot_path():
+    return os.path.join(SNAPSHOT_DIR, f"corpus-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl.gz")
+
+class SnapshotWriter:
+    """
+    Appends scraped page Documents to a gzip-compressed JSONL snapshot
+
+    The first line is a header with the format name and version; every other
+    line is one page. Safe to call from several scraping threads.
+    """
+
+    def __init__(self, path, source=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._write_line({
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "created_at": datetime.now().isoformat(),
+            "source": source
+        })
+
+    def _write_line(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def write(self, document):
+        with self._lock:
+            self._write_line({"page_content": document.page_content, "metadata": document.metadata})
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        print(f"Saved {self.count} pages to snapshot {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# Function to stream page Documents back out of a snapshot without loading it all
+def read_snapshot(path):
+    """
+    Open a snapshot and check its header, then return an iterator over its
+    page Documents, read one at a time
+
+    Raises:
+        OSError: If the file cannot be opened
+        ValueError: If the file is not a snapshot or has an unsupported version
+    """
+    f = gzip.open(path, "rt", encoding="utf-8")
+    try:
+        header = json.loads(f.readline() or "{}")
+        if header.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"{path} is not a corpus snapshot")
+        if header.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {header.get('version')} in {path}")
+    except Exception:
+        f.close()
+        raise
+    print(f"Reading snapshot {path} created at {header.get('created_at')}")
+    return _read_pages(f)
+
+def _read_pages(f):
+    with f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield Document(page_content=record["page_content"], metadata=record["metadata"])
@@ -2,6 +2,8 @@ import os
 import re
 from urllib.parse import urljoin, urlparse
 from datetime import datetime
+from functools import lru_cache
+import tiktoken
 from langchain_core.documents import Document
 
 # Function to extract component name from URL
@@ -16,9 +18,41 @@ def extract_component_name(url):
         return match.group(1)
     return None
 
-# Function to determine which collection to use for a component
-def get_collection_name_for_component(component_name):
+# Storage layout: "per_component" keeps one collection per component,
+# "shared" stores every component in one collection filtered by component name
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "per_component")
+SHARED_COLLECTION_NAME = os.getenv("SHARED_COLLECTION_NAME", "applique_docs")
+# Indexed payload field used to route queries inside the shared collection
+COMPONENT_NAME_FIELD = "metadata.component_name"
+# Compact copy of the vectors Qdrant searches first: "none", "scalar" (int8) or "binary" (1 bit)
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+# With quantization, this many times the requested hits are rescored with the full-precision vectors
+QUANTIZATION_OVERSAMPLING = float(os.getenv("QUANTIZATION_OVERSAMPLING", "2.0"))
+# Collection searched when a query cannot be routed
+FALLBACK_COLLECTION_NAME = "applique_components"
+
+def is_shared_layout():
+    return STORAGE_LAYOUT == "shared"
+
+# Function to get the dedicated collection of a component in the per-component layout
+def get_per_component_collection_name(component_name):
     # Simple approach: use the component name directly as collection name
     # Replace dashes with underscores for better compatibility
     collection_name = f"applique_{component_name.replace('-', '_')}"
-    return collection_name 
\ No newline at end of file
+    return collection_name
+
+# Function to determine which collection to use for a component
+def get_collection_name_for_component(component_name):
+    if is_shared_layout():
+        return SHARED_COLLECTION_NAME
+    return get_per_component_collection_name(component_name) 
+
+# Function to load the tokenizer used by the OpenAI embedding and chat models
+@lru_cache(maxsize=None)
+def get_tokenizer():
+    # text-embedding-3-* and gpt-3.5/gpt-4 models share the cl100k_base encoding
+    return tiktoken.get_encoding("cl100k_base")
+
+# Function to count the tokens in a piece of text
+def count_tokens(text):
+    return len(get_tokenizer().encode(text, disallowed_special=()))